@@ -1,15 +1,49 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from functools import partial
+from functools import partial, wraps
+from contextlib import contextmanager, nullcontext
+from collections import deque, OrderedDict
 import random
 import copy
 import time
-import re
-import pygame
+import json
 import sys
 import os
+import argparse
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import tempfile
+from types import SimpleNamespace
+import queue
+import threading
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+try:
+    import numpy as np
+except ImportError:  # only needed for the batch helpers
+    np = None
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+except ImportError:  # only needed for the GUI
+    tk = ttk = messagebox = None
+
+pygame = None  # imported by load_pygame when the GUI starts
 
 # SUDOKU GENERATOR
+DIFFICULTY_HOLES = {"easy": 30, "medium": 45, "hard": 60}
+# Interactive callers generate within this many seconds, checking
+# uniqueness with at most this many search nodes per removed number.
+GENERATE_DEADLINE = 0.2
+GENERATE_MAX_NODES = 20000
+# A worker round trip costs about as much as a check of a hundred nodes,
+# so parallel digging only farms out checks bigger than this.
+PARALLEL_MIN_NODES = 1000
+
 class SudokuGenerator:
     def __init__(self):
         self.grid = [[0 for _ in range(9)] for _ in range(9)]
@@ -60,29 +94,997 @@ class SudokuGenerator:
         backtrack()
         return solutions[0]
 
-    def remove_numbers(self, grid, holes):
-        """Remove numbers while keeping a unique solution."""
+    def remove_numbers(self, grid, holes, deadline=None, max_nodes=None, cancel=None):
+        """Remove numbers while keeping a unique solution.
+
+        Digging stops early once time.monotonic() passes deadline. Every
+        uniqueness check is capped at max_nodes; a check that runs out
+        keeps the number in place. Setting the cancel event stops digging
+        like the deadline does. Sets self.finished to False when either of
+        them cut digging short.
+        """
         grid = copy.deepcopy(grid)
         attempts = holes
+        self.finished = True
         while attempts > 0:
+            if deadline is not None and time.monotonic() >= deadline or cancel is not None and cancel.is_set():
+                self.finished = False
+                break
             row, col = random.randint(0, 8), random.randint(0, 8)
             while grid[row][col] == 0:
                 row, col = random.randint(0, 8), random.randint(0, 8)
             backup = grid[row][col]
             grid[row][col] = 0
-            if self.solve_count(grid) != 1:
+            if solve_grid(grid, 2, max_nodes, cancel)[0] != 1:
                 grid[row][col] = backup
             attempts -= 1
         return grid
 
-    def generate(self, holes):
-        """Generate a puzzle with a given number of possible holes."""
+    def remove_numbers_parallel(self, grid, holes, pool, deadline=None, max_nodes=None, batch=16,
+                                min_nodes=PARALLEL_MIN_NODES, cancel=None):
+        """Like remove_numbers, but checks batch removals at once on pool.
+
+        Candidates are tried in a shuffled order and the result is the same
+        as checking them one by one in that order, whatever the workers'
+        timing. Most checks are far cheaper than a trip to a worker, so they
+        run here until one needs more than min_nodes search nodes, and go
+        back here after a pool round where none did.
+
+        While most removals get accepted, a round checks chained snapshots
+        (the first k candidates all removed) and keeps the longest unique
+        prefix. Once most get rejected, a round checks each candidate
+        against the same snapshot: a rejection stays valid after later
+        removals, while an acceptance behind one committed this round is
+        re-checked in the next round. Unused checks are cancelled. The
+        cancel event is checked between rounds.
+        """
+        grid = copy.deepcopy(grid)
+        cells = [(r, c) for r in range(9) for c in range(9) if grid[r][c]]
+        random.shuffle(cells)
+        pending = deque(cells[:holes])
+        parallel = False
+        chained = True
+        self.finished = True
+        while pending:
+            if deadline is not None and time.monotonic() >= deadline or cancel is not None and cancel.is_set():
+                self.finished = False
+                break
+            if not parallel:
+                row, col = pending.popleft()
+                backup, grid[row][col] = grid[row][col], 0
+                count, _, nodes = solve_grid(grid, 2, max_nodes, cancel)
+                if count != 1:
+                    grid[row][col] = backup
+                parallel = nodes > min_nodes
+                continue
+            round_cells = [pending.popleft() for _ in range(min(batch, len(pending)))]
+            trial = copy.deepcopy(grid)
+            futures = []
+            for row, col in round_cells:
+                trial[row][col] = 0
+                futures.append(pool.submit(_solve_job, format_grid(trial), max_nodes))
+                if not chained:
+                    trial[row][col] = grid[row][col]
+            accepted = 0
+            most_nodes = 0
+            retry = []
+            for n, ((row, col), future) in enumerate(zip(round_cells, futures)):
+                try:
+                    wait = None if deadline is None else max(deadline - time.monotonic(), 0)
+                    count, _, nodes = future.result(wait)
+                except concurrent.futures.TimeoutError:
+                    # Out of time: keep what was committed, drop the rest
+                    for future in futures[n:]:
+                        future.cancel()
+                    self.finished = False
+                    return grid
+                most_nodes = max(most_nodes, nodes)
+                if count != 1:
+                    if chained:
+                        # Later snapshots lacked this number too; redo them.
+                        for future in futures[n + 1:]:
+                            future.cancel()
+                        retry = round_cells[n + 1:]
+                        break
+                elif chained or not accepted:
+                    grid[row][col] = 0
+                    accepted += 1
+                else:
+                    retry.append((row, col))
+            pending.extendleft(reversed(retry))
+            chained = 2 * accepted >= len(round_cells) - len(retry)
+            parallel = most_nodes > min_nodes
+        return grid
+
+    def generate(self, holes, deadline=None, max_nodes=None, pool=None, cancel=None):
+        """Generate a puzzle with a given number of possible holes.
+
+        Each of the holes attempts removes a random number if the puzzle
+        stays unique, so fewer holes may be dug. deadline is a time budget
+        in seconds. When it runs out, the puzzle dug so far is returned; it
+        is always valid and unique. The actual clue count ends up in
+        self.clues, self.target_met says whether at least holes cells are
+        empty, and self.finished whether every attempt was made. With a
+        process pool, uniqueness checks run in parallel (see
+        remove_numbers_parallel). Setting the cancel event (a
+        threading.Event) from another thread stops digging early.
+        """
+        if deadline is not None:
+            deadline += time.monotonic()
         self.grid = [[0 for _ in range(9)] for _ in range(9)]
         self.fill_grid(self.grid)
         self.full_solution = copy.deepcopy(self.grid)
-        puzzle = self.remove_numbers(self.full_solution, holes)
+        if pool is None:
+            puzzle = self.remove_numbers(self.full_solution, holes, deadline, max_nodes, cancel)
+        else:
+            puzzle = self.remove_numbers_parallel(self.full_solution, holes, pool, deadline, max_nodes, cancel=cancel)
+        self.clues = sum(1 for row in puzzle for value in row if value)
+        self.target_met = 81 - self.clues >= holes
         return puzzle
 
+# BATCH CANDIDATES
+# Cells are indexed 0..80 row by row; a candidate mask has bit d-1 set
+# when digit d may still go in the cell.
+ALL_DIGITS = 0x1FF
+ROW_OF = [i // 9 for i in range(81)]
+COL_OF = [i % 9 for i in range(81)]
+BOX_OF = [3 * (i // 27) + (i % 9) // 3 for i in range(81)]
+UNITS = (
+    [[i for i in range(81) if ROW_OF[i] == n] for n in range(9)]
+    + [[i for i in range(81) if COL_OF[i] == n] for n in range(9)]
+    + [[i for i in range(81) if BOX_OF[i] == n] for n in range(9)]
+)
+
+if np is not None:
+    _DIGIT_BIT = np.array([0] + [1 << d for d in range(9)], dtype=np.uint16)
+    _POPCOUNT = np.array([bin(m).count("1") for m in range(512)], dtype=np.uint8)
+    _SINGLE_DIGIT = np.array(
+        [m.bit_length() if m and not m & (m - 1) else 0 for m in range(512)],
+        dtype=np.uint8,
+    )
+
+
+def _as_batch(puzzles):
+    """Validate and convert puzzles to an (N, 81) uint8 array."""
+    if np is None:
+        raise ImportError("numpy is required for batch candidate computation")
+    grids = np.asarray(puzzles)
+    if grids.ndim == 3:
+        grids = grids.reshape(len(grids), 81)
+    if grids.ndim != 2 or grids.shape[1] != 81:
+        raise ValueError(f"expected an (N, 81) array, got shape {grids.shape}")
+    if grids.size and (grids.min() < 0 or grids.max() > 9):
+        raise ValueError("puzzle values must be between 0 and 9")
+    return grids.astype(np.uint8)
+
+
+def _unit_masks(grids):
+    """OR together the digit bits of every row, column and box."""
+    bits = _DIGIT_BIT[grids].reshape(-1, 9, 9)
+    rows = np.bitwise_or.reduce(bits, axis=2)
+    cols = np.bitwise_or.reduce(bits, axis=1)
+    boxes = np.bitwise_or.reduce(
+        np.bitwise_or.reduce(bits.reshape(-1, 3, 3, 3, 3), axis=4), axis=2
+    ).reshape(-1, 9)
+    return rows, cols, boxes
+
+
+def _has_conflict(grids):
+    """True for every puzzle with a repeated digit in some unit."""
+    filled = (grids > 0).reshape(-1, 9, 9)
+    counts = (
+        filled.sum(axis=2),
+        filled.sum(axis=1),
+        filled.reshape(-1, 3, 3, 3, 3).sum(axis=(2, 4)).reshape(-1, 9),
+    )
+    return np.logical_or.reduce([
+        (_POPCOUNT[mask] != count).any(axis=1)
+        for mask, count in zip(_unit_masks(grids), counts)
+    ])
+
+
+def batch_candidates(puzzles):
+    """Return the (N, 81) candidate bitmasks for a batch of puzzles.
+
+    Filled cells get a mask of 0.
+    """
+    grids = _as_batch(puzzles)
+    rows, cols, boxes = _unit_masks(grids)
+    used = rows[:, ROW_OF] | cols[:, COL_OF] | boxes[:, BOX_OF]
+    return np.where(grids == 0, ~used & ALL_DIGITS, 0).astype(np.uint16)
+
+
+def batch_propagate(puzzles, max_rounds=81):
+    """Fill naked singles in a batch of puzzles until nothing changes.
+
+    Returns (grids, status): status is 1 for solved puzzles, -1 for
+    contradictions and 0 for puzzles that still need a search.
+    """
+    grids = _as_batch(puzzles).copy()
+    active = np.ones(len(grids), dtype=bool)
+    for _ in range(max_rounds):
+        idx = np.flatnonzero(active)
+        if not idx.size:
+            break
+        sub = grids[idx]
+        cand = batch_candidates(sub)
+        dead = _has_conflict(sub) | ((sub == 0) & (cand == 0)).any(axis=1)
+        singles = _SINGLE_DIGIT[cand]
+        progress = singles.any(axis=1) & ~dead
+        grids[idx] = np.where(progress[:, None] & (singles > 0), singles, sub)
+        active[idx[~progress]] = False
+
+    status = np.zeros(len(grids), dtype=np.int8)
+    dead = _has_conflict(grids) | ((grids == 0) & (batch_candidates(grids) == 0)).any(axis=1)
+    status[(grids > 0).all(axis=1)] = 1
+    status[dead] = -1
+    return grids, status
+
+# FAST SOLVER
+_BIT_COUNT = [bin(m).count("1") for m in range(512)]
+
+
+def _unit_bits(values):
+    """Digit bits used in every row, column and box, or None on a clash."""
+    rows, cols, boxes = [0] * 9, [0] * 9, [0] * 9
+    for i, value in enumerate(values):
+        if value:
+            bit = 1 << (value - 1)
+            r, c, b = ROW_OF[i], COL_OF[i], BOX_OF[i]
+            if (rows[r] | cols[c] | boxes[b]) & bit:
+                return None
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+    return rows, cols, boxes
+
+
+def iter_solutions(grid, limit=None, max_nodes=None, stats=None, cancel=None):
+    """Yield the solutions of a 9x9 grid one at a time, as new grids.
+
+    The search works on a single board with a stack of at most 81 frames,
+    so memory stays flat however many solutions exist. Stop early with
+    limit, max_nodes, by closing the generator (e.g. itertools.islice) or
+    from another thread by setting cancel, a threading.Event that is
+    checked every 4096 nodes.
+    If stats is a dict it receives "nodes", the number of digits tried, and
+    "complete", True once the whole search space has been explored.
+    """
+    if stats is None:
+        stats = {}
+    stats["nodes"] = 0
+    stats["complete"] = False
+    values = [value for row in grid for value in row]
+    units = _unit_bits(values)
+    if units is None:
+        stats["complete"] = True
+        return
+    rows, cols, boxes = units
+    empty = [i for i in range(81) if not values[i]]
+
+    def pick():
+        """Empty cell with the fewest candidates, or None when the board is full."""
+        best, best_mask, best_n = None, 0, 10
+        for i in empty:
+            if values[i]:
+                continue
+            mask = ~(rows[ROW_OF[i]] | cols[COL_OF[i]] | boxes[BOX_OF[i]]) & ALL_DIGITS
+            n = _BIT_COUNT[mask]
+            if n < best_n:
+                best, best_mask, best_n = i, mask, n
+                if n <= 1:
+                    break
+        return best, best_mask
+
+    nodes = 0
+    found = 0
+    try:
+        cell, mask = pick()
+        if cell is None:
+            yield [values[r * 9:r * 9 + 9] for r in range(9)]
+            stats["complete"] = True
+            return
+        stack = [[cell, mask, 0]]
+        while stack:
+            frame = stack[-1]
+            cell, mask, bit = frame
+            r, c, b = ROW_OF[cell], COL_OF[cell], BOX_OF[cell]
+            if bit:
+                values[cell] = 0
+                rows[r] ^= bit
+                cols[c] ^= bit
+                boxes[b] ^= bit
+            if not mask:
+                stack.pop()
+                continue
+            bit = mask & -mask
+            frame[1] = mask ^ bit
+            frame[2] = bit
+            nodes += 1
+            if max_nodes is not None and nodes > max_nodes:
+                return
+            if cancel is not None and not nodes & 4095 and cancel.is_set():
+                return
+            values[cell] = bit.bit_length()
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+            cell, mask = pick()
+            if cell is None:
+                yield [values[r * 9:r * 9 + 9] for r in range(9)]
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+            elif mask:
+                stack.append([cell, mask, 0])
+        stats["complete"] = True
+    finally:
+        stats["nodes"] = nodes
+
+
+def solve_grid(grid, limit=2, max_nodes=None, cancel=None):
+    """Solve a 9x9 grid with bitmask backtracking, fewest candidates first.
+
+    Returns (count, solution, nodes). count stops at limit, solution is the
+    first solution found (None if there is none) and nodes counts the digits
+    tried. If max_nodes runs out or cancel is set first, count is None.
+    """
+    stats = {}
+    count, first = 0, None
+    for solution in iter_solutions(grid, limit, max_nodes, stats, cancel):
+        count += 1
+        if first is None:
+            first = solution
+    if count < limit and not stats["complete"]:
+        count = None
+    return count, first, stats["nodes"]
+
+
+def find_conflicts(grid):
+    """Positions of numbers that repeat in some row, column or box."""
+    values = [value for row in grid for value in row]
+    clashes = set()
+    for unit in UNITS:
+        seen = {}
+        for i in unit:
+            if values[i]:
+                seen.setdefault(values[i], []).append(i)
+        for same in seen.values():
+            if len(same) > 1:
+                clashes.update(same)
+    return sorted(divmod(i, 9) for i in clashes)
+
+# RATING
+def _fill_singles(values, hidden):
+    """Place naked (and optionally hidden) singles in place until stuck.
+
+    Returns False if a contradiction shows up.
+    """
+    progress = True
+    while progress:
+        progress = False
+        units = _unit_bits(values)
+        if units is None:
+            return False
+        rows, cols, boxes = units
+        candidates = [0] * 81
+        for i in range(81):
+            if not values[i]:
+                mask = ~(rows[ROW_OF[i]] | cols[COL_OF[i]] | boxes[BOX_OF[i]]) & ALL_DIGITS
+                if not mask:
+                    return False
+                candidates[i] = mask
+                if _BIT_COUNT[mask] == 1:
+                    values[i] = mask.bit_length()
+                    progress = True
+        if progress or not hidden:
+            continue
+        for unit in UNITS:
+            for digit in range(1, 10):
+                bit = 1 << (digit - 1)
+                places = [i for i in unit if candidates[i] & bit]
+                if len(places) == 1 and not values[places[0]]:
+                    values[places[0]] = digit
+                    progress = True
+    return True
+
+
+def rate_puzzle(grid, max_nodes=200000):
+    """Grade a puzzle by what it takes to solve it.
+
+    easy needs only naked singles, medium also needs hidden singles and hard
+    needs guessing. Returns a dict with the grade, clue count, uniqueness and
+    search nodes; grade is None for puzzles without a unique solution.
+    """
+    clues = sum(1 for row in grid for value in row if value)
+    count, _, nodes = solve_grid(grid, limit=2, max_nodes=max_nodes)
+    rating = {"difficulty": None, "clues": clues, "unique": count == 1, "nodes": nodes}
+    if count != 1:
+        return rating
+    for difficulty, hidden in (("easy", False), ("medium", True)):
+        values = [value for row in grid for value in row]
+        if _fill_singles(values, hidden) and all(values):
+            rating["difficulty"] = difficulty
+            return rating
+    rating["difficulty"] = "hard"
+    return rating
+
+# GRID STRINGS
+def format_grid(grid):
+    """Write a 9x9 grid as 81 digits, 0 for empty cells."""
+    return "".join(str(value) for row in grid for value in row)
+
+def parse_grid(text):
+    """Read 81 digits back into a 9x9 grid."""
+    values = [int(ch) for ch in text]
+    return [values[r * 9:r * 9 + 9] for r in range(9)]
+
+def parse_puzzle(text):
+    """Read a puzzle typed or pasted by a person.
+
+    Blanks may be written as 0, '.' or '_'. Whitespace and grid drawing
+    characters (| - +) are ignored. Raises ValueError unless exactly 81
+    cells remain.
+    """
+    cells = []
+    for ch in text:
+        if ch.isdigit():
+            cells.append(ch)
+        elif ch in "._":
+            cells.append("0")
+        elif not (ch.isspace() or ch in "|-+"):
+            raise ValueError(f"unexpected character {ch!r} in puzzle")
+    if len(cells) != 81:
+        raise ValueError(f"a puzzle needs 81 cells, got {len(cells)}")
+    return parse_grid("".join(cells))
+
+def import_puzzle(text, max_nodes=200000):
+    """Parse and solve a puzzle typed or pasted by a person.
+
+    Returns (puzzle, solution). Raises ValueError when the text isn't a
+    puzzle, breaks the rules, has no or several solutions, or can't be
+    solved within max_nodes.
+    """
+    puzzle = parse_puzzle(text)
+    if find_conflicts(puzzle):
+        raise ValueError("a number repeats in a row, column or box")
+    count, solution, _ = solve_grid(puzzle, limit=2, max_nodes=max_nodes)
+    if count is None:
+        raise ValueError("the puzzle is too hard to solve quickly")
+    if count == 0:
+        raise ValueError("the puzzle has no solution")
+    if count > 1:
+        raise ValueError("the puzzle has more than one solution")
+    return puzzle, solution
+
+# CANONICAL FORM
+_COLUMN_ORDERS = [
+    tuple(3 * stack + i for stack, inner in zip(stacks, inners) for i in inner)
+    for stacks in itertools.permutations(range(3))
+    for inners in itertools.product(itertools.permutations(range(3)), repeat=3)
+]
+
+def canonical_form(grid):
+    """Smallest equivalent of a puzzle under the Sudoku symmetries.
+
+    The symmetries are transposing, reordering bands and stacks, reordering
+    rows inside a band and columns inside a stack, and relabelling digits.
+    Returns (canonical, transform). canonical is the lexicographically
+    smallest 81-digit string over all of them, with digits numbered in order
+    of first appearance. transform is what from_canonical() needs to map
+    canonical grids back.
+
+    Rows are chosen one at a time, keeping only the candidates that tie for
+    the smallest row so far. Candidates that would see the same remaining
+    grid are merged, which keeps sparse puzzles from multiplying them.
+    """
+    orientations = (tuple(map(tuple, grid)), tuple(zip(*grid)))
+    columns = (orientations[1], orientations[0])
+
+    def merged(states):
+        seen = {}
+        for state in states:
+            t, used, order, labels = state
+            key = (t, frozenset(used), used[-1] // 3, tuple(columns[t][c] for c in order), labels)
+            seen.setdefault(key, state)
+        return list(seen.values())
+
+    # The first row is always relabelled 1, 2, 3... so only its clue pattern
+    # matters, and the smallest pattern puts the emptiest stacks first.
+    def smallest_pattern(row):
+        counts = sorted(sum(1 for c in range(3 * s, 3 * s + 3) if row[c]) for s in range(3))
+        return [int(i >= 3 - n) for n in counts for i in range(3)]
+
+    patterns = {(t, r): smallest_pattern(rows[r]) for t, rows in enumerate(orientations) for r in range(9)}
+    first = min(patterns.values())
+    states = []
+    for (t, r), pattern in patterns.items():
+        if pattern != first:
+            continue
+        row = orientations[t][r]
+        for order in _COLUMN_ORDERS:
+            if [1 if row[c] else 0 for c in order] == first:
+                labels = [0] * 10
+                n = 0
+                for c in order:
+                    if row[c]:
+                        n += 1
+                        labels[row[c]] = n
+                states.append((t, (r,), order, tuple(labels)))
+    states = merged(states)
+    canonical, n = [], 0
+    for bit in first:
+        n += bit
+        canonical.append(n if bit else 0)
+
+    for k in range(1, 9):
+        best, survivors = None, []
+        for t, used, order, labels in states:
+            rows = orientations[t]
+            if k % 3:
+                band = used[-1] // 3 * 3
+                options = [r for r in range(band, band + 3) if r not in used]
+            else:
+                done = {r // 3 for r in used}
+                options = [r for r in range(9) if r // 3 not in done]
+            for r in options:
+                row = rows[r]
+                new = list(labels)
+                n = max(labels)
+                key = []
+                for c in order:
+                    value = row[c]
+                    if value:
+                        if not new[value]:
+                            n += 1
+                            new[value] = n
+                        key.append(new[value])
+                    else:
+                        key.append(0)
+                if best is None or key < best:
+                    best, survivors = key, []
+                if key == best:
+                    survivors.append((t, used + (r,), order, tuple(new)))
+        states = merged(survivors)
+        canonical.extend(best)
+    return "".join(map(str, canonical)), states[0]
+
+def from_canonical(text, transform):
+    """Map an 81-digit grid in canonical coordinates back to the original
+    puzzle's rows, columns and digits (e.g. a memoised solution)."""
+    t, row_order, col_order, labels = transform
+    inverse = [0] * 10
+    for digit in range(1, 10):
+        if labels[digit]:
+            inverse[labels[digit]] = digit
+    # Digits the puzzle never uses still need a label in a full grid
+    spare = iter(d for d in range(1, 10) if not labels[d])
+    for label in range(1, 10):
+        if not inverse[label]:
+            inverse[label] = next(spare)
+    grid = [[0] * 9 for _ in range(9)]
+    for i, r in enumerate(row_order):
+        for j, c in enumerate(col_order):
+            grid[r][c] = inverse[int(text[i * 9 + j])]
+    if t:
+        grid = [list(col) for col in zip(*grid)]
+    return grid
+
+# SAVE GAME
+def save_dir():
+    """Folder that holds the saved game."""
+    return os.path.join(os.path.expanduser("~"), ".sudoku")
+
+class GameJournal:
+    """Saved game kept as a snapshot plus an append-only journal of moves.
+
+    Every move is one short line appended to the journal, so saving costs
+    the same no matter how long the game is. After compact_every moves the
+    caller writes a fresh snapshot, which empties the journal again.
+    The snapshot and the journal's first line share an id, so a journal
+    left over from an older snapshot (a crash inside start) is ignored.
+    """
+
+    def __init__(self, folder=None, compact_every=200):
+        folder = folder or save_dir()
+        self.snapshot_path = os.path.join(folder, "game.json")
+        self.journal_path = os.path.join(folder, "moves.log")
+        self.compact_every = compact_every
+        self.moves = 0
+        self.file = None
+
+    def start(self, state):
+        """Write state as the new snapshot and start an empty journal."""
+        self.close()
+        journal_id = f"{time.time_ns():x}{random.getrandbits(32):08x}"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({**state, "journal": journal_id}, f)
+            os.replace(tmp_path, self.snapshot_path)
+            self.file = open(self.journal_path, "w", encoding="utf-8")
+            self.file.write(f"j {journal_id}\n")
+            self.file.flush()
+        except OSError:
+            self.file = None
+        self.moves = 0
+
+    def append(self, row, col, value, pencil, elapsed):
+        """Record one move. Returns True once the journal should be compacted."""
+        return self._write(f"{row} {col} {value} {pencil} {elapsed:.1f}\n")
+
+    def append_time(self, elapsed):
+        """Record the clock, e.g. when the game is paused."""
+        return self._write(f"t {elapsed:.1f}\n")
+
+    def _write(self, line):
+        if self.file is None:
+            return False
+        try:
+            self.file.write(line)
+            self.file.flush()
+        except OSError:
+            self.file = None
+            return False
+        self.moves += 1
+        return self.moves >= self.compact_every
+
+    def load(self):
+        """Return the saved state with the journal replayed, or None if
+        there is no usable save."""
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+            parse_grid(state["puzzle"])
+            parse_grid(state["solution"])
+            values = [int(ch) for ch in state["values"]]
+            pencil = [int(marks) for marks in state["pencil"]]
+            int(state["difficulty"])
+            float(state["elapsed"])
+            if len(state["puzzle"]) != 81 or len(state["solution"]) != 81 or len(values) != 81 or len(pencil) != 81:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # Saves from before journal ids have a journal without a header
+        journal_id = state.pop("journal", None)
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                header = f.readline().split()
+                if journal_id is None:
+                    f.seek(0)
+                    lines = f
+                else:
+                    lines = f if header == ["j", journal_id] else ()
+                for line in lines:
+                    parts = line.split()
+                    try:
+                        if len(parts) == 2 and parts[0] == "t":
+                            state["elapsed"] = float(parts[1])
+                        elif len(parts) == 5:
+                            row, col, value, marks = map(int, parts[:4])
+                            values[row * 9 + col] = value
+                            pencil[row * 9 + col] = marks
+                            state["elapsed"] = float(parts[4])
+                    except (ValueError, IndexError):
+                        break  # torn last line after a crash
+        except OSError:
+            pass
+        state["values"] = "".join(map(str, values))
+        state["pencil"] = pencil
+        return state
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+# PUZZLE INDEX
+class LRUCache:
+    """Dict that keeps only the most recently used max_size entries."""
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+class PuzzleIndex:
+    """Puzzles stored on disk (SQLite) under their canonical form.
+
+    Equivalent puzzles share one row, so a bank can be deduplicated and each
+    puzzle is solved and rated only once. Solutions are stored in canonical
+    coordinates and mapped back for the caller. An in-memory LRU layer
+    caches canonical forms and recent rows.
+    """
+
+    def __init__(self, path=None, cache_size=4096):
+        if path is None:
+            os.makedirs(save_dir(), exist_ok=True)
+            path = os.path.join(save_dir(), "puzzles.db")
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS puzzles "
+            "(canonical TEXT PRIMARY KEY, solution TEXT, rating TEXT)"
+        )
+        self.forms = LRUCache(cache_size)
+        self.rows = LRUCache(cache_size)
+
+    def canonical(self, grid):
+        """(canonical, transform) for grid, cached."""
+        key = format_grid(grid)
+        form = self.forms.get(key)
+        if form is None:
+            form = canonical_form(grid)
+            self.forms.put(key, form)
+        return form
+
+    def _row(self, canonical):
+        row = self.rows.get(canonical)
+        if row is None:
+            found = self.db.execute(
+                "SELECT solution, rating FROM puzzles WHERE canonical = ?", (canonical,)
+            ).fetchone()
+            if found is None:
+                return None
+            row = {"solution": found[0], "rating": found[1] and json.loads(found[1])}
+            self.rows.put(canonical, row)
+        return row
+
+    def _save(self, canonical, row):
+        self.db.execute(
+            "INSERT OR REPLACE INTO puzzles (canonical, solution, rating) VALUES (?, ?, ?)",
+            (canonical, row["solution"], row["rating"] and json.dumps(row["rating"])),
+        )
+        self.rows.put(canonical, row)
+
+    def _add(self, grid):
+        canonical, _ = self.canonical(grid)
+        if self._row(canonical) is not None:
+            return False
+        self._save(canonical, {"solution": None, "rating": None})
+        return True
+
+    def add(self, grid):
+        """Store grid; returns False if an equivalent puzzle was already there."""
+        added = self._add(grid)
+        self.db.commit()
+        return added
+
+    def dedupe(self, grids, commit_every=1000):
+        """Yield the grids that are not equivalent to anything seen before."""
+        try:
+            for n, grid in enumerate(grids, 1):
+                if self._add(grid):
+                    yield grid
+                if n % commit_every == 0:
+                    self.db.commit()
+        finally:
+            self.db.commit()
+
+    def solution(self, grid):
+        """The unique solution of grid, or None. Solved once per class."""
+        canonical, transform = self.canonical(grid)
+        row = self._row(canonical) or {"solution": None, "rating": None}
+        if row["solution"] is None:
+            count, solution, _ = solve_grid(parse_grid(canonical), limit=2)
+            row = dict(row, solution=format_grid(solution) if count == 1 else "")
+            self._save(canonical, row)
+            self.db.commit()
+        return from_canonical(row["solution"], transform) if row["solution"] else None
+
+    def rating(self, grid):
+        """rate_puzzle() for grid, computed once per class."""
+        canonical, _ = self.canonical(grid)
+        row = self._row(canonical) or {"solution": None, "rating": None}
+        if row["rating"] is None:
+            row = dict(row, rating=rate_puzzle(parse_grid(canonical)))
+            self._save(canonical, row)
+            self.db.commit()
+        return row["rating"]
+
+    def close(self):
+        self.db.close()
+
+def read_puzzles(lines, file=sys.stderr):
+    """Puzzles from a corpus, one per line. Blank lines and # comments are
+    skipped; malformed lines are reported on file and skipped too."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.startswith("#"):
+            continue
+        try:
+            yield parse_puzzle(line.split()[0])
+        except ValueError as error:
+            print(f"line {number}: skipped, {error}", file=file)
+
+# UNDO HISTORY
+class UndoHistory:
+    """Undo/redo stacks made of small per-cell deltas.
+
+    A delta is (row, col, old_value, old_pencil, new_value, new_pencil).
+    Deltas recorded between two commit() calls form one entry, so a
+    multi-cell edit is undone in one step. Only the newest max_entries
+    entries are kept.
+    """
+
+    def __init__(self, max_entries=500):
+        self.undo_stack = deque(maxlen=max_entries)
+        self.redo_stack = []
+        self.pending = []
+
+    def record(self, row, col, old_value, old_pencil, new_value, new_pencil):
+        if (old_value, old_pencil) != (new_value, new_pencil):
+            self.pending.append((row, col, old_value, old_pencil, new_value, new_pencil))
+
+    def commit(self):
+        """Close the current entry."""
+        if self.pending:
+            self.undo_stack.append(tuple(self.pending))
+            self.pending = []
+            self.redo_stack.clear()
+
+    def undo(self):
+        """Return the entry to revert, or None if there is nothing to undo."""
+        self.commit()
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return entry
+
+    def redo(self):
+        """Return the entry to apply again, or None."""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return entry
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.pending = []
+
+# TIMER
+class TickScheduler:
+    """Calls callback on the Tk event loop with at most one pending after().
+
+    The callback returns the delay in ms until the next tick, or None to stop.
+    """
+
+    def __init__(self, master, callback):
+        self.master = master
+        self.callback = callback
+        self.job = None
+
+    def start(self, delay=0):
+        """(Re)start ticking, replacing any pending tick."""
+        self.stop()
+        self.job = self.master.after(delay, self._tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.master.after_cancel(self.job)
+            self.job = None
+
+    def _tick(self):
+        self.job = None
+        delay = self.callback()
+        if delay is not None and self.job is None:
+            self.job = self.master.after(delay, self._tick)
+
+# LATENCY TRACING
+class LatencyTracer:
+    """Times GUI event handlers and the phases inside them.
+
+    Names nest: a check_errors run inside cell_clicked is recorded as
+    "cell_clicked/check_errors". The newest window samples per name are
+    kept for percentiles. When trace_path is set, every sample is also
+    appended to that file as a JSON line.
+    """
+
+    def __init__(self, trace_path=None, window=200):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.stack = []
+        self.trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+
+    @contextmanager
+    def phase(self, name):
+        path = "/".join(self.stack + [name])
+        self.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            self.add(path, elapsed)
+
+    def wrap(self, name, func, redraw=None):
+        """Return func timed as phase name. When it runs as a top-level
+        event, redraw() is timed right after it as its tk_redraw phase."""
+        @wraps(func)
+        def timed(*args, **kwargs):
+            outermost = not self.stack
+            with self.phase(name):
+                result = func(*args, **kwargs)
+                if outermost and redraw is not None:
+                    with self.phase("tk_redraw"):
+                        redraw()
+            return result
+        return timed
+
+    def add(self, name, seconds):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+        self.samples[name].append(seconds)
+        self.counts[name] += 1
+        if self.trace is not None:
+            self.trace.write(json.dumps({"time": time.time(), "name": name, "ms": round(seconds * 1000, 3)}) + "\n")
+
+    def summary(self):
+        """{name: (count, p50 ms, p95 ms)} over the recent samples."""
+        report = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            report[name] = (self.counts[name], percentile(ordered, 0.5) * 1000, percentile(ordered, 0.95) * 1000)
+        return report
+
+    def format_summary(self):
+        return "\n".join(
+            f"{name:<40} n={count:<6} p50 {p50:7.2f} ms  p95 {p95:7.2f} ms"
+            for name, (count, p50, p95) in sorted(self.summary().items())
+        )
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+# RENDERING
+class CellRenderer:
+    """Batches changes to the grid labels into one config() per cell.
+
+    set() only records the options a cell should end up with; flush() sends
+    each label the options that differ from what it already shows.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.shown = {}
+        self.wanted = {}
+
+    def add(self, pos, label, **options):
+        """Register a label and the options it was created with."""
+        self.labels[pos] = label
+        self.shown[pos] = options
+        self.wanted.pop(pos, None)
+
+    def set(self, pos, **options):
+        self.wanted.setdefault(pos, {}).update(options)
+
+    def flush(self):
+        for pos, options in self.wanted.items():
+            shown = self.shown[pos]
+            changes = {k: v for k, v in options.items() if shown.get(k) != v}
+            if changes:
+                self.labels[pos].config(**changes)
+                shown.update(changes)
+        self.wanted.clear()
+
 # RESOURCE PATH
 def resource_path(relative_path):
     """Get absolute path to resource, works for PyInstaller."""
@@ -92,15 +1094,126 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def load_pygame():
+    """Import pygame on first use. Headless commands never need it, and its
+    banner would otherwise end up in their stdout."""
+    global pygame
+    if pygame is None:
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        import pygame as module
+        pygame = module
+    return pygame
+
+# DIALOGS
+class Dialog:
+    """Popup window that is built once, then shown and hidden with new text.
+
+    The mouse wheel is bound on the dialog's own window, so it only scrolls
+    this dialog and leaves no global binding behind.
+    """
+
+    def __init__(self, master, color, width=600, height=400, hidden=False):
+        self.hidden = hidden  # update content on show() but never map it
+        self.window = tk.Toplevel(master)
+        self.window.withdraw()
+        self.window.config(bg=color)
+        x = (self.window.winfo_screenwidth() - width) // 2
+        y = (self.window.winfo_screenheight() - height) // 2
+        self.window.geometry(f"{width}x{height}+{x}+{y}")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.on_close = None
+
+        container = tk.Frame(self.window, bg=color)
+        container.pack(fill="both", expand=True)
+
+        # Canvas + Scrollbar
+        canvas = tk.Canvas(container, bg=color, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(container, orient="vertical", command=canvas.yview)
+        self.body = tk.Frame(canvas, bg=color)
+        self.body.bind(
+            "<Configure>",
+            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+        )
+        canvas.create_window((0, 0), window=self.body, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.window.bind("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
+
+        # Text
+        self.label = tk.Label(
+            self.body,
+            bg=color,
+            foreground="white",
+            font=("SF Pro Display", 14),
+            wraplength=550,
+            justify="left",
+        )
+        self.label.pack(padx=20, pady=20, fill="both", expand=True)
+
+        # Buttons, reused between shows
+        self.btn_frame = tk.Frame(self.body, bg=color)
+        self.btn_frame.pack(side="top")
+        self.buttons = []
+
+    def show(self, title, message, buttons=None, close_text=None, on_close=None):
+        """Show the dialog with new content. buttons maps labels to callbacks
+        run after the dialog hides; close_text adds a button that calls on_close."""
+        self.window.title(title)
+        self.label.config(text=message)
+        self.on_close = on_close
+        entries = [
+            (text, lambda c=command: [self.hide(), c()] if c else self.hide())
+            for text, command in (buttons or {}).items()
+        ]
+        if close_text:
+            entries.append((close_text, self.close))
+        while len(self.buttons) < len(entries):
+            self.buttons.append(ttk.Button(self.btn_frame, style="game.TButton"))
+        for button in self.buttons:
+            button.pack_forget()
+        for button, (text, command) in zip(self.buttons, entries):
+            button.config(text=text, command=command)
+            button.pack(pady=10)
+        if not self.hidden:
+            self.window.deiconify()
+            self.window.lift()
+
+    def hide(self):
+        self.window.withdraw()
+
+    def close(self):
+        self.hide()
+        if self.on_close:
+            self.on_close()
+
 # GUI
 class SudokuGUI:
-    def __init__(self, master):
+    # Event handlers (and sub-phases) timed when a LatencyTracer is given
+    traced_handlers = (
+        "handle_key", "handle_key_input", "cell_clicked", "select_number",
+        "global_click", "clear_selection", "toggle_Mode", "toggle_inputMode",
+        "undo", "redo", "check_errors", "start_game", "continue_game",
+        "choose_difficulty", "start_with_difficulty", "import_popup", "import_game",
+        "see_solution", "check_numbers", "start_over", "show_rules_popup",
+        "back_to_menu", "settings_popup", "toggle_lang", "toggle_music", "set_volume",
+    )
+
+    def __init__(self, master, tracer=None, journal=None, audio=True):
         self.master = master
+        self.audio = audio  # False skips pygame and the music track
         self.master.title("Sudoku")
+        self.tracer = tracer
+        if tracer:
+            for name in self.traced_handlers:
+                setattr(self, name, tracer.wrap(name, getattr(self, name), self.master.update_idletasks))
         self.master.bind_all("<Key>", self.handle_key)
         self.master.bind("<Button-1>", self.global_click)
         self.master.bind("<Button-3>", self.clear_selection)
         self.master.bind("<Key>", self.handle_key_input)
+        self.master.bind_all("<Control-z>", self.undo)
+        self.master.bind_all("<Control-y>", self.redo)
+        self.master.bind_all("<Control-Z>", self.redo)
         self.master.config(cursor="hand2")
 
         # Game state variables
@@ -108,8 +1221,12 @@ class SudokuGUI:
         self.running = False
         self.startTime = 0
         self.pauseTime = 0
+        self.shownSeconds = None
+        self.timer = TickScheduler(self.master, self.update_timer)
         self.cells = {}
+        self.render = CellRenderer()
         self.selectedCells = set()
+        self.editDepth = 0
         self.inputMode = "cell_first"
         self.pencilMode = False
         self.clearMode = False
@@ -125,15 +1242,26 @@ class SudokuGUI:
         self.volume = 0.5
         self.lang = "en"
         self.number_buttons = []
+        self.dialogs = {}
+        self.hide_dialogs = False
+        self.settings_widgets = None
+        self.import_widgets = None
+        self.journal = journal or GameJournal()
+        self.history = UndoHistory()
+        self.saved_state = self.journal.load()
+        if self.saved_state:
+            self.gameStarted = True
 
 
         # Music
-        pygame.mixer.init()
-        music_file = resource_path("music.mp3")
-        pygame.mixer.music.load(music_file)
-        pygame.mixer.music.set_volume(self.volume)  # výchozí hlasitost 50 %
-        pygame.mixer.music.play(-1)
-        pygame.mixer.music.pause()
+        if self.audio:
+            load_pygame()
+            pygame.mixer.init()
+            music_file = resource_path("music.mp3")
+            pygame.mixer.music.load(music_file)
+            pygame.mixer.music.set_volume(self.volume)  # výchozí hlasitost 50 %
+            pygame.mixer.music.play(-1)
+            pygame.mixer.music.pause()
         
         # Ttk styles
         self.style = ttk.Style()
@@ -169,6 +1297,7 @@ class SudokuGUI:
                 "button3": "Rules",
                 "button4": "Settings",
                 "button5": "Quit",
+                "import_puzzle": "Import Puzzle",
 
                 # --- Difficulty & Game Start ---
                 "popup_start_title": "Start Game",
@@ -180,6 +1309,10 @@ class SudokuGUI:
                 "easy": "Easy",
                 "medium": "Medium",
                 "hard": "Hard",
+                "import_title": "Import Puzzle",
+                "import_text": "Type or paste a puzzle: 81 digits, with 0 or . for empty cells.",
+                "import_play": "Play",
+                "import_invalid": "This puzzle can't be played:",
                 # --- In-game Buttons ---
                 "button6": "See Solved/Done",
                 "button7": "Check Numbers",
@@ -217,6 +1350,7 @@ class SudokuGUI:
                     "• Cell-first: Select cell(s), then choose a number or type it.\n"
                     "• You can select multiple cells at once in Cell-first mode.\n"
                     "• Press R to see the rules or pause the timer.\n"
+                    "• Ctrl+Z undoes a move, Ctrl+Y redoes it.\n"
                     "• Use ESC to exit fullscreen.\n"
                 ),
                 # --- Misc ---
@@ -230,6 +1364,7 @@ class SudokuGUI:
                 "button3": "Pravidla",
                 "button4": "Nastavení",
                 "button5": "Odejít",
+                "import_puzzle": "Vložit sudoku",
                 # --- Difficulty & Game Start ---
                 "popup_start_title": "Spustit hru",
                 "popup_start_text": "Chceš pokračovat nebo začít novou hru?",
@@ -240,6 +1375,10 @@ class SudokuGUI:
                 "easy": "Lehká",
                 "medium": "Střední",
                 "hard": "Těžká",
+                "import_title": "Vložit sudoku",
+                "import_text": "Napiš nebo vlož sudoku: 81 číslic, prázdné buňky jako 0 nebo tečka.",
+                "import_play": "Hrát",
+                "import_invalid": "Toto sudoku nejde hrát:",
                 # --- In-game Buttons ---
                 "button6": "Zobrazit řešení",
                 "button7": "Zkontrolovat čísla",
@@ -277,6 +1416,7 @@ class SudokuGUI:
                     "• Režim buňka-první: Vyber buňky a pak číslo.\n"
                     "• Můžeš vybrat více buněk najednou.\n"
                     "• Klávesou R otevřeš pravidla nebo pauzneš čas.\n"
+                    "• Ctrl+Z vrátí tah, Ctrl+Y ho zopakuje.\n"
                     "• Klávesou ESC ukončíš režim celé obrazovky.\n"
                 ),
                 # --- Misc ---
@@ -286,6 +1426,24 @@ class SudokuGUI:
         }
         self.create_main_menu()
 
+        # Latency overlay
+        if self.tracer:
+            self.debug_label = tk.Label(
+                self.master, font=("Menlo", 10), justify="left", bg="black", foreground="#7CFC00"
+            )
+            self.debug_label.place(relx=1.0, rely=1.0, anchor="se")
+            self.debug_ticker = TickScheduler(self.master, self.update_debug_overlay)
+            self.debug_ticker.start()
+
+    def phase(self, name):
+        """Time a block as a sub-phase of the current event when tracing."""
+        return self.tracer.phase(name) if self.tracer else nullcontext()
+
+    def update_debug_overlay(self):
+        self.debug_label.config(text=self.tracer.format_summary() or "no events yet")
+        self.debug_label.lift()
+        return 1000
+
     # Key binding
     def handle_key(self, event):
         key = event.char.lower()
@@ -309,7 +1467,7 @@ class SudokuGUI:
             self.lang = "cz"
         for widget in self.menu_frame.winfo_children():
             widget.destroy()
-        self.reopen_settings()
+        self.settings_popup()
         self.create_main_menu()
     
 # MENU
@@ -343,6 +1501,14 @@ class SudokuGUI:
             style="menu.TButton",
         ).pack(pady=10)
 
+        ttk.Button(
+            self.menu_frame,
+            text=self.t("import_puzzle"),
+            width=20,
+            command=self.import_popup,
+            style="menu.TButton",
+        ).pack(pady=10)
+
         ttk.Button(
             self.menu_frame,
             text=self.t("button3"),
@@ -380,6 +1546,11 @@ class SudokuGUI:
             self.choose_difficulty()
 
     def continue_game(self):
+        if self.saved_state:
+            # Game saved by an earlier run, build its screen first
+            self.setup_game_screen(self.saved_state)
+            self.saved_state = None
+            return
         self.menu_frame.pack_forget()
         self.resume_timer()
         self.game_frame.pack(fill="both", expand=True)
@@ -387,19 +1558,58 @@ class SudokuGUI:
     def choose_difficulty(self):
         text = self.t("difficulty_text")
         buttons = {
-            self.t("easy"): lambda: self.start_with_difficulty(30),
-            self.t("medium"): lambda: self.start_with_difficulty(45),
-            self.t("hard"): lambda: self.start_with_difficulty(60)
+            self.t("easy"): lambda: self.start_with_difficulty(DIFFICULTY_HOLES["easy"]),
+            self.t("medium"): lambda: self.start_with_difficulty(DIFFICULTY_HOLES["medium"]),
+            self.t("hard"): lambda: self.start_with_difficulty(DIFFICULTY_HOLES["hard"])
         }
-        self.popup(self.t("difficulty_title"), text, buttons)
+        self.popup(self.t("difficulty_title"), text, buttons, kind="difficulty")
         
     def start_with_difficulty(self, difficulty):
         self.difficulty = difficulty
         self.gameStarted = True
+        self.saved_state = None
         self.setup_game_screen()
 
+    def import_popup(self):
+        dialog = self.dialog("import")
+        if self.import_widgets is None:
+            entry = tk.Text(dialog.body, width=30, height=11, font=("Menlo", 14))
+            # No "all" tag: typing here must not trigger the game's shortcuts
+            entry.bindtags((str(entry), "Text", str(entry.winfo_toplevel())))
+            entry.pack(pady=5)
+            play_btn = ttk.Button(dialog.body, style="game.TButton", command=self.import_game)
+            play_btn.pack(pady=10)
+            close_btn = ttk.Button(dialog.body, style="game.TButton", command=dialog.close)
+            close_btn.pack(pady=10)
+            self.import_widgets = {"entry": entry, "play": play_btn, "close": close_btn}
+        self.import_widgets["play"].config(text=self.t("import_play"))
+        self.import_widgets["close"].config(text=self.t("close"))
+        dialog.show(self.t("import_title"), self.t("import_text"))
+
+    def import_game(self):
+        """Start a game from the puzzle typed into the import dialog."""
+        dialog = self.dialog("import")
+        try:
+            puzzle, solution = import_puzzle(self.import_widgets["entry"].get("1.0", "end"))
+        except ValueError as error:
+            dialog.label.config(text=f"{self.t('import_text')}\n\n{self.t('import_invalid')} {error}.")
+            return
+        dialog.hide()
+        self.import_widgets["entry"].delete("1.0", "end")
+        holes = sum(1 for row in puzzle for value in row if not value)
+        self.gameStarted = True
+        self.saved_state = None
+        self.setup_game_screen({
+            "puzzle": format_grid(puzzle),
+            "solution": format_grid(solution),
+            "difficulty": holes,
+            "values": format_grid(puzzle),
+            "pencil": [0] * 81,
+            "elapsed": 0,
+        })
+
 # GAME SCREEN
-    def setup_game_screen(self):
+    def setup_game_screen(self, state=None):
         # Screen setup 
         self.menu_frame.pack_forget()
         for widget in self.game_frame.winfo_children():
@@ -413,8 +1623,9 @@ class SudokuGUI:
         )
         self.timer_label.pack(pady=5)
         self.running = True
-        self.startTime = time.time()
-        self.update_timer()
+        self.startTime = time.time() - (state["elapsed"] if state else 0)
+        self.shownSeconds = None
+        self.timer.start()
         
         # Buttons
         controls0 = tk.Frame(self.game_frame, bg=self.color)
@@ -450,9 +1661,21 @@ class SudokuGUI:
         sudoku_frame.grid(row=0, column=0, sticky="n")
         self.grid_frame = tk.Frame(sudoku_frame, bg=self.color)
         self.grid_frame.pack()
-        self.puzzle = self.generator.generate(holes = self.difficulty)
+        if state:
+            self.difficulty = state["difficulty"]
+            self.puzzle = parse_grid(state["puzzle"])
+            self.generator.grid = parse_grid(state["solution"])
+            self.generator.full_solution = copy.deepcopy(self.generator.grid)
+        else:
+            self.puzzle = self.generator.generate(holes = self.difficulty, deadline = GENERATE_DEADLINE, max_nodes = GENERATE_MAX_NODES)
         self.cells = {}
         self.generate_puzzle()
+        if state:
+            for i, (value, pencil) in enumerate(zip(state["values"], state["pencil"])):
+                if not self.cells[divmod(i, 9)]["fixed"]:
+                    self.set_cell(i // 9, i % 9, int(value), pencil, record=False)
+            self.check_errors()
+        self.save_game()
 
         # Number pad
         pad_frame = tk.Frame(main_frame, bg=self.color,)
@@ -486,26 +1709,40 @@ class SudokuGUI:
 
     # Timer
     def update_timer(self):
+        """Show the elapsed time; returns ms until the next whole second."""
         if not self.running:
-            return
-        elapsed = int(time.time() - self.startTime)
-        mins, secs = divmod(elapsed, 60)
-        self.timer_label.config(text=f"Time: {mins:02}:{secs:02}")
-        self.master.after(1000, self.update_timer)
+            return None
+        elapsed = time.time() - self.startTime
+        seconds = int(elapsed)
+        if seconds != self.shownSeconds:
+            self.shownSeconds = seconds
+            mins, secs = divmod(seconds, 60)
+            self.timer_label.config(text=f"Time: {mins:02}:{secs:02}")
+        return 1000 - int((elapsed - seconds) * 1000)
 
     def pauseTimer(self):
         if self.running:
+            self.timer.stop()
             self.running = False
             self.pauseTime = time.time() - self.startTime
+            self.journal.append_time(self.pauseTime)
+
+    def elapsed(self):
+        return time.time() - self.startTime if self.running else self.pauseTime
 
     def resume_timer(self):
         if not self.running:
             self.running = True
             self.startTime = time.time() - self.pauseTime
-            self.update_timer()
+            self.timer.start()
 
     # Grid generator
     def generate_puzzle(self):
+        self.history.clear()
+        self.render = CellRenderer()
+        self.selectedCells.clear()
+        for widget in self.grid_frame.winfo_children():
+            widget.destroy()
         for row in range(9):
             for col in range(9):
                 value = self.puzzle[row][col]
@@ -524,22 +1761,111 @@ class SudokuGUI:
                 )
                 frame.grid(row=row, column=col, padx=(left, right), pady=(top, bottom))
                 bg_color = "#FFFFFF" if (row // 3 + col // 3) % 2 == 0 else "#DCE6EB"
-                cell = tk.Label(
-                    frame,
+                options = dict(
                     text=cell_text,
                     width=2,
                     height=1,
                     font=("SF Pro Display", 25),
-                    relief="solid",
-                    borderwidth=1,
                     bg=bg_color,
+                    foreground="black",
                 )
+                cell = tk.Label(frame, relief="solid", borderwidth=1, **options)
                 cell.pack(fill="both", expand=True)
                 cell.bind("<Button-1>", lambda e, r=row, c=col: self.cell_clicked(r, c))
-                self.cells[(row, col)] = {"label": cell, "fixed": value != 0}
+                self.cells[(row, col)] = {"label": cell, "fixed": value != 0, "value": value, "pencil": 0}
+                self.render.add((row, col), cell, **options)
+
+    # Cell state
+    def set_cell(self, row, col, value, pencil=0, record=True, undoable=True):
+        """Change a cell's number or pencil marks (bitmask) and show it."""
+        cell_data = self.cells[(row, col)]
+        if record and undoable:
+            self.history.record(row, col, cell_data["value"], cell_data["pencil"], value, pencil)
+        cell_data["value"] = value
+        cell_data["pencil"] = pencil
+        if pencil:
+            marks = [str(n) for n in range(1, 10) if pencil & (1 << (n - 1))]
+            lines = [" ".join(marks[i:i+3]) for i in range(0, len(marks), 3)]
+            self.render.set(
+                (row, col),
+                text="\n".join(lines),
+                font=("SF Pro Display", 7),
+                width=6, height=3,
+            )
+        else:
+            self.render.set(
+                (row, col),
+                text="" if value == 0 else str(value),
+                font=("SF Pro Display", 25),
+                width=2, height=1,
+            )
+        if record and self.journal.append(row, col, value, pencil, self.elapsed()):
+            self.save_game()
+
+    @contextmanager
+    def edit(self):
+        """Group the cell changes made inside the block into one undo step,
+        then check for errors and redraw once when the outermost block ends."""
+        self.editDepth += 1
+        try:
+            yield
+        finally:
+            self.editDepth -= 1
+            if self.editDepth == 0:
+                self.history.commit()
+                self.check_errors()
+
+    def apply_to_selection(self, num, pencil=False):
+        """Place num (0 clears) or toggle pencil mark num in every selected
+        cell in a single pass. Fixed cells are skipped."""
+        with self.edit():
+            for (r, c) in self.selectedCells:
+                if self.cells[(r, c)]["fixed"]:
+                    continue
+                if pencil and num != 0:
+                    self.toggle_pencil_number(r, c, num)
+                else:
+                    self.set_cell(r, c, num)
+
+    # Undo / redo
+    def undo(self, event=None):
+        if not self.running:
+            return
+        entry = self.history.undo()
+        if entry:
+            with self.edit():
+                for row, col, old_value, old_pencil, _, _ in reversed(entry):
+                    self.set_cell(row, col, old_value, old_pencil, undoable=False)
+
+    def redo(self, event=None):
+        if not self.running:
+            return
+        entry = self.history.redo()
+        if entry:
+            with self.edit():
+                for row, col, _, _, new_value, new_pencil in entry:
+                    self.set_cell(row, col, new_value, new_pencil, undoable=False)
+
+    # Save game
+    def game_state(self):
+        """Current game as a plain dict for the save file."""
+        cells = [self.cells[divmod(i, 9)] for i in range(81)]
+        return {
+            "puzzle": format_grid(self.puzzle),
+            "solution": format_grid(self.generator.grid),
+            "difficulty": self.difficulty,
+            "values": "".join(str(c["value"]) for c in cells),
+            "pencil": [c["pencil"] for c in cells],
+            "elapsed": round(self.elapsed(), 1),
+        }
+
+    def save_game(self):
+        """Write a fresh snapshot, which also compacts the move journal."""
+        self.journal.start(self.game_state())
 
     # Number pad
     def create_number_pad(self, frame):
+        self.number_buttons = []
         btn_frame = tk.Frame(frame, bg=self.color)
         btn_frame.pack()
 
@@ -615,15 +1941,7 @@ class SudokuGUI:
             if not self.selectedCells:
                 messagebox.showinfo("No Cell Selected", self.t("no_cell_selected"))
                 return
-
-            for (r, c) in self.selectedCells:
-                if self.pencilMode and num != 0:
-                    self.toggle_pencil_number(r, c, num)
-                else:
-                    if self.cells[(r, c)]["fixed"]:
-                        return
-                    self.place_number_in_selected(num)
-        self.check_errors()
+            self.apply_to_selection(num, pencil=self.pencilMode)
 
     # Top buttons
     def see_solution(self):
@@ -638,12 +1956,16 @@ class SudokuGUI:
         for row in range(9):
              for col in range(9):
                 value =self.full_solution[row][col]
-                self.cells[(row, col)]["label"].config(text=str(value), foreground="black")
+                self.set_cell(row, col, value, record=False)
+                self.render.set((row, col), foreground="black")
+        self.render.flush()
+        self.history.clear()
+        self.save_game()
              
     def start_over(self):
         text = self.t("start_over_text")
         buttons = {
-                self.t("erase_numbers"): lambda:self.generate_puzzle(),
+                self.t("erase_numbers"): lambda:[self.generate_puzzle(), self.save_game()],
                 self.t("new_puzzle"): lambda:self.setup_game_screen(),
         }
         self.popup(self.t("see_solution_title"), text, buttons)
@@ -652,29 +1974,11 @@ class SudokuGUI:
     def check_numbers(self):
         self.full_solution = self.generator.grid
         all_correct = True
-        for row in range(9):
-            for col in range(9):
-                cell = self.cells[(row, col)]["label"]
-                cell_text = cell.cget("text").strip()
-                # ignore empty cells
-                if not cell_text or cell_text == "0":
-                    continue   
-                font = cell.cget("font")
-                if isinstance(font, tuple):
-                    font_size = font[1]
-                else:
-                    font_size = int(re.search(r'\d+', font).group())
-                # ignore pencil marks
-                if font_size < 10:
-                    continue
-                try:
-                    value = int(cell_text)
-                except ValueError:
-                    continue
-                if value != self.full_solution[row][col]:
-                    all_correct = False
-                    break
-            if not all_correct:
+        for (row, col), cell_data in self.cells.items():
+            # empty cells and pencil marks have no value
+            value = cell_data["value"]
+            if value and value != self.full_solution[row][col]:
+                all_correct = False
                 break
         if all_correct:
             messagebox.showinfo("Check", self.t("check_ok"))
@@ -684,46 +1988,13 @@ class SudokuGUI:
     # Pencil
     def toggle_pencil_number(self, row, col, num):
         """Toggle a pencil number in a cell. If num=0, clear all pencil marks."""
-        cell = self.cells[(row, col)]["label"]
+        cell_data = self.cells[(row, col)]
         if num == 0:
-            cell.config(text="", font=("SF Pro Display", 25), width=2, height=1)
+            self.set_cell(row, col, 0, 0)
             return
-
-        current_text = cell.cget("text")
-        font = cell.cget("font")
-        if isinstance(font, tuple):
-            font_size = font[1]
-        else:
-            font_size = int(re.search(r'\d+', font).group())
-        if font_size > 10 and current_text!="":
+        if cell_data["value"]:
             return
-        pencil_numbers = set(current_text.replace("\n", " ").split()) if current_text else set()
-        num_str = str(num)
-
-        if num_str in pencil_numbers:
-            pencil_numbers.remove(num_str)
-        else:
-            pencil_numbers.add(num_str)
-
-        sorted_numbers = sorted(pencil_numbers)
-        lines = [" ".join(sorted_numbers[i:i+3]) for i in range(0, len(sorted_numbers), 3)]
-        formatted_text = "\n".join(lines)
-
-        if pencil_numbers:
-            cell.config(
-                text=formatted_text,
-                font=("SF Pro Display", 7),
-                width=6, height=3,
-                foreground="black"
-            )
-        else:
-            cell.config(
-                text="",
-                font=("SF Pro Display", 25),
-                width=2, height=1,
-                foreground="black"
-            )
-        self.check_errors
+        self.set_cell(row, col, 0, cell_data["pencil"] ^ (1 << (num - 1)))
 
     # Cell actions
     def cell_clicked(self, row, col):
@@ -734,39 +2005,35 @@ class SudokuGUI:
         if cell_data["fixed"]:
             return
 
-        cell = self.cells[(row, col)]["label"]
         if self.inputMode == "number_first":
             if self.currentNumber is None:
                 messagebox.showinfo("No Number Selected", "Select a number first!")
                 return
 
-            if self.pencilMode and self.currentNumber != 0:
-                self.toggle_pencil_number(row, col, self.currentNumber)
-            else:
-                cell.config(font=("SF Pro Display", 25), width=2, height=1)
-                if self.currentNumber == 0:
-                    cell.config(text="")
+            with self.edit():
+                if self.pencilMode and self.currentNumber != 0:
+                    self.toggle_pencil_number(row, col, self.currentNumber)
                 else:
-                    cell.config(text=str(self.currentNumber))
+                    self.set_cell(row, col, self.currentNumber)
         else:
             self.toggle_cell_selection(row, col)
-        self.check_errors()
+            self.render.flush()
 
     def toggle_cell_selection(self, row, col):
         """Toggle selection highlight for a cell."""
-        cell = self.cells[(row, col)]["label"]
         if (row, col) in self.selectedCells:
             self.selectedCells.remove((row, col))
-            cell.config(bg= "#FFFFFF" if (row // 3 + col // 3) % 2 == 0 else "#DCE6EB")
+            self.render.set((row, col), bg= "#FFFFFF" if (row // 3 + col // 3) % 2 == 0 else "#DCE6EB")
         else:
             self.selectedCells.add((row, col))
-            cell.config(bg="#BCE7FF")
+            self.render.set((row, col), bg="#BCE7FF")
 
     def clear_selection(self, event=None):
         """Clear all highlighted cells."""
         for (r, c) in self.selectedCells:
-            self.cells[(r, c)]["label"].config(bg = "#FFFFFF" if (r // 3 + c// 3) % 2 == 0 else "#DCE6EB")
+            self.render.set((r, c), bg = "#FFFFFF" if (r // 3 + c// 3) % 2 == 0 else "#DCE6EB")
         self.selectedCells.clear()
+        self.render.flush()
 
     def global_click(self, event):
         widget = event.widget
@@ -775,11 +2042,7 @@ class SudokuGUI:
 
     def place_number_in_selected(self, num):
         """Place a number in all selected cells."""
-        for (r, c) in self.selectedCells:
-            if self.cells[(r, c)]["fixed"]:
-                return
-            self.cells[(r, c)]["label"].config(font=("SF Pro Display", 25), width=2, height=1)
-            self.cells[(r, c)]["label"].config(text="" if num == 0 else str(num))
+        self.apply_to_selection(num)
 
     def handle_key_input(self, event):
         if not self.running:
@@ -792,84 +2055,42 @@ class SudokuGUI:
                 self.toggle_Mode(False)           
         else:
             if event.char.isdigit() and event.char != "0":
-                num = int(event.char)
-                if self.pencilMode:
-                    for r, c in self.selectedCells:
-                        self.toggle_pencil_number(r, c, num)
-                else:
-                    self.place_number_in_selected(num)
+                self.apply_to_selection(int(event.char), pencil=self.pencilMode)
             elif event.keysym in ("BackSpace", "Delete"):
-                self.place_number_in_selected(0)
-        self.check_errors()
+                self.apply_to_selection(0)
 
     # Errors
     def check_errors(self):
-        """Check all cells for conflicts. Pencil marks are handled separately."""
-        for cell_data in self.cells.values():
-            cell_data["label"].config(foreground="black")
-
-        rows = {r: {} for r in range(9)}
-        cols = {c: {} for c in range(9)}
-        boxes = {(r // 3, c // 3): {} for r in range(9) for c in range(9)}
-
-        for (r, c), cell_data in self.cells.items():
-            cell = cell_data["label"]
-            text = cell.cget("text").strip()
-            if not text:
-                continue
-
-            f = cell.cget("font")
-            if isinstance(f, tuple):
-                font_size = f[1]
-            else:
-                m = re.search(r'\d+', f)
-                font_size = int(m.group()) if m else 20
-
-            is_pencil = font_size < 10
-            values = text.split()
-            for val in values:
-                if not is_pencil:
-                    rows[r].setdefault(val, []).append((r, c))
-                    cols[c].setdefault(val, []).append((r, c))
-                    boxes[(r // 3, c // 3)].setdefault(val, []).append((r, c))
-                else:
-                    rows[r].setdefault('_pencil', []).append((val, (r, c)))
-                    cols[c].setdefault('_pencil', []).append((val, (r, c)))
-                    boxes[(r // 3, c // 3)].setdefault('_pencil', []).append((val, (r, c)))
-
-        self.mark_conflicts(rows)
-        self.mark_conflicts(cols)
-        self.mark_conflicts(boxes)
-
-    def mark_conflicts(self, structure):
-        for group in structure.values():
-            for val, positions in group.items():
-                if val == '_pencil':
-                    continue
-                if len(positions) > 1:
-                    for pos in positions:
-                        if self.cells[pos]["fixed"]:
-                            continue
-                        cell = self.cells[pos]["label"]
-                        f = cell.cget("font")
-                        font_size = f[1] if isinstance(f, tuple) else int(re.search(r'\d+', f).group())
-                        if font_size >= 10:
-                            cell.config(foreground="red")
-
-            if '_pencil' in group:
-                for val, pos in group['_pencil']:
-                    cell = self.cells[pos]["label"]
-                    if val in group and any(
-                        self.cells["label"][p].cget("font")[1] >= 10 if isinstance(self.cells["label"][p].cget("font"), tuple)
-                        else int(re.search(r'\d+', self.cells["label"][p].cget("font")).group()) >= 10
-                        for p in group[val]
-                    ):
-                        cell.config(foreground="red")
+        """Colour conflicting numbers red, and pencil marks that clash with a
+        placed number in the same row, column or box. Then redraw the grid."""
+        with self.phase("conflicts"):
+            red = self.find_red_cells()
+        for pos in self.cells:
+            self.render.set(pos, foreground="red" if pos in red else "black")
+        with self.phase("render"):
+            self.render.flush()
+
+    def find_red_cells(self):
+        red = set()
+        for unit in UNITS:
+            positions = [divmod(i, 9) for i in unit]
+            seen = {}
+            for pos in positions:
+                value = self.cells[pos]["value"]
+                if value:
+                    seen.setdefault(value, []).append(pos)
+            placed = 0
+            for value, same in seen.items():
+                placed |= 1 << (value - 1)
+                if len(same) > 1:
+                    red.update(pos for pos in same if not self.cells[pos]["fixed"])
+            red.update(pos for pos in positions if self.cells[pos]["pencil"] & placed)
+        return red
 
     # Bottom buttons
         # Leave game
     def back_to_menu(self):
-        self.running = False
+        self.pauseTimer()
         self.clear_selection()
         self.game_frame.pack_forget()
         self.menu_frame.pack(expand=True, fill="both")
@@ -885,184 +2106,837 @@ class SudokuGUI:
         self.clear_selection()
 
 # POPUPS
-    def popup(self, title, message, buttons=None, close = True):
-        popup = tk.Toplevel(self.master)
-        popup.title(title)
-        popup.geometry("600x400")
-        popup.config(bg=self.color)
-
-        container = tk.Frame(popup, bg=self.color)
-        container.pack(fill="both", expand=True)
-
-        # Canvas + Scrollbar
-        canvas = tk.Canvas(container, bg=self.color, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(container, orient="vertical", command=canvas.yview)
-        scroll_frame = tk.Frame(canvas, bg=self.color)
-
-        scroll_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-
-        canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-
-        # Scroll mouse
-        def _on_mousewheel(event):
-            canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-
-        canvas.bind_all("<MouseWheel>", _on_mousewheel)
-
-        # Text 
-        label = tk.Label(
-            scroll_frame,
-            text=message,
-            bg=self.color,
-            foreground="white",
-            font=("SF Pro Display", 14),
-            wraplength=550,
-            justify="left",
+    def dialog(self, kind):
+        """The dialog used for kind (rules, settings, ...), built on first use."""
+        if kind not in self.dialogs:
+            self.dialogs[kind] = Dialog(self.master, self.color, hidden=self.hide_dialogs)
+        return self.dialogs[kind]
+
+    def popup(self, title, message, buttons=None, close = True, kind="confirm"):
+        self.dialog(kind).show(
+            title, message, buttons,
+            close_text=self.t("close") if close else None,
+            on_close=self.resume_timer,
         )
-        label.pack(padx=20, pady=20, fill="both", expand=True)
-
-        # buttons
-        btn_frame = tk.Frame(scroll_frame, bg=self.color)
-        btn_frame.pack( side="top")
-
-        if buttons:
-            for text, command in buttons.items():
-                ttk.Button(
-                    btn_frame,
-                    text=text,
-                    style="game.TButton",
-                    command=lambda c=command: [popup.destroy(), c()] if c else popup.destroy()
-                ).pack( pady=10)
-        
-        def close_popup():
-            popup.destroy()
-            self.resume_timer()
-
-        if close:
-            ttk.Button(
-                btn_frame,
-                text=self.t("close"),
-                style="game.TButton",
-                command=close_popup
-            ).pack(pady=10)
-
-            # --- Center on screen ---
-        self.center_popup(popup, 600, 400)
-
-    def center_popup(self, popup, width=600, height=400):
-        popup.update_idletasks()  # aktualizuj rozměry
-        screen_width = popup.winfo_screenwidth()
-        screen_height = popup.winfo_screenheight()
-
-        x = (screen_width // 2) - (width // 2)
-        y = (screen_height // 2) - (height // 2)
-
-        popup.geometry(f"{width}x{height}+{x}+{y}")
 
     # Rules
     def show_rules_popup(self):
-        self.popup(self.t("rules_title"), self.t("rules_text"))
+        self.popup(self.t("rules_title"), self.t("rules_text"), kind="rules")
         self.pauseTimer()
 
     # Settings
-    def settings_popup(self):
-
-        # --- Music toggle function ---
-        def toggle_music():
-            if self.music:
+    def toggle_music(self):
+        if self.music:
+            if self.audio:
                 pygame.mixer.music.pause()
-                self.music = False
-                toggle_btn.config(text=self.t("music_on"))
-            else:
+            self.music = False
+        else:
+            if self.audio:
                 pygame.mixer.music.unpause()
-                self.music = True
-                toggle_btn.config(text=self.t("music_off"))
+            self.music = True
+        self.settings_widgets["music"].config(text=self.t("music_off") if self.music else self.t("music_on"))
 
-        # --- Volume control function ---
-        def set_volume(val):
-            volume = float(val)
-            self.volume = volume/100
+    def set_volume(self, val):
+        volume = float(val)
+        self.volume = volume/100
+        if self.audio:
             pygame.mixer.music.set_volume(self.volume)
 
-        # --- Create popup using your existing popup() function ---
-        self.popup(self.t("settings_title"), self.t("settings_title")+":", close = False)
-
-        # --- Access the last opened popup (your popup creates a new Toplevel) ---
-        popup = self.master.winfo_children()[-1]
-
-        # --- Find scroll_frame (3 layers deep inside popup structure) ---
-        # container -> canvas -> scroll_frame
-        container = popup.winfo_children()[0]
-        canvas = container.winfo_children()[0]
-        scroll_frame = canvas.winfo_children()[0]
+    def settings_popup(self):
+        dialog = self.dialog("settings")
+        if self.settings_widgets is None:
+            body = dialog.body
+            lang_btn = ttk.Button(body, style="game.TButton", command=self.toggle_lang)
+            lang_btn.pack(pady=10)
+
+            # --- On/Off button ---
+            music_btn = ttk.Button(body, style="game.TButton", command=self.toggle_music)
+            music_btn.pack(pady=10)
+
+            # --- Volume slider ---
+            volume_slider = tk.Scale(
+                body,
+                from_=0,
+                to=100,
+                orient="horizontal",
+                resolution=0.05,
+                length=250,
+                bg=self.color,
+                foreground="white",
+                highlightthickness=0,
+                troughcolor="#022132",
+                command=self.set_volume
+            )
+            volume_slider.pack(pady=5)
+
+            close_btn = ttk.Button(body, style="game.TButton", command=dialog.close)
+            close_btn.pack(pady=10)
+            self.settings_widgets = {"lang": lang_btn, "music": music_btn, "volume": volume_slider, "close": close_btn}
+
+        widgets = self.settings_widgets
+        widgets["lang"].config(text=self.t("lang"))
+        widgets["music"].config(text=self.t("music_off") if self.music else self.t("music_on"))
+        widgets["close"].config(text=self.t("close"))
+        widgets["volume"].set(self.volume*100)
+        dialog.show(self.t("settings_title"), self.t("settings_title")+":", on_close=self.resume_timer)
+
+# PUZZLE SERVICE
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def worker_pool(workers=None):
+    """Process pool for engine jobs. Each worker reseeds random, so forked
+    workers don't all generate the same puzzles."""
+    return ProcessPoolExecutor(workers, initializer=random.seed)
+
+def _generate_job(holes, deadline=None, max_nodes=None, cancel=None):
+    """Returns (puzzle, solution, clues, target_met), grids as strings."""
+    generator = SudokuGenerator()
+    puzzle = generator.generate(holes, deadline, max_nodes, cancel=cancel)
+    return format_grid(puzzle), format_grid(generator.grid), generator.clues, generator.target_met
+
+def _solve_job(text, max_nodes):
+    count, solution, nodes = solve_grid(parse_grid(text), limit=2, max_nodes=max_nodes)
+    return count, solution and format_grid(solution), nodes
+
+def _rate_job(text, max_nodes):
+    return rate_puzzle(parse_grid(text), max_nodes)
+
+class ServiceBusy(Exception):
+    """Raised when max_inflight jobs are already queued or running."""
+
+class PuzzleService:
+    """The puzzle engine behind the HTTP server.
+
+    All work runs on a pool of worker processes. The pool also keeps a few
+    ready puzzles queued per difficulty, so most generate requests are
+    answered from the queue.
+    """
+
+    def __init__(self, workers=None, ready_size=4, max_inflight=32, max_nodes=200000, timeout=30,
+                 deadline=GENERATE_DEADLINE):
+        self.pool = worker_pool(workers)
+        self.ready = {name: queue.Queue() for name in DIFFICULTY_HOLES}
+        self.pending = dict.fromkeys(DIFFICULTY_HOLES, 0)
+        self.ready_size = ready_size
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        for name in DIFFICULTY_HOLES:
+            self._refill(name)
+
+    def _refill(self, name):
+        with self.lock:
+            if self.closed:
+                return
+            missing = max(self.ready_size - self.ready[name].qsize() - self.pending[name], 0)
+            self.pending[name] += missing
+        for _ in range(missing):
+            future = self.pool.submit(_generate_job, DIFFICULTY_HOLES[name], self.deadline, GENERATE_MAX_NODES)
+            future.add_done_callback(partial(self._stock, name))
+
+    def _stock(self, name, future):
+        with self.lock:
+            self.pending[name] -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.ready[name].put(future.result())
+            self._refill(name)
+
+    def _run(self, job, *args):
+        """Run job on the pool and wait up to timeout for it.
+
+        The job holds an in-flight slot until it ends, even after the caller
+        stops waiting, so max_inflight bounds the pool's backlog. A job still
+        queued when the wait times out is cancelled.
+        """
+        if not self.slots.acquire(blocking=False):
+            raise ServiceBusy("too many requests")
+        try:
+            future = self.pool.submit(job, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def generate(self, difficulty=None, holes=None):
+        if holes is not None:
+            if not 0 <= holes <= 81:
+                raise ValueError("holes must be between 0 and 81")
+            puzzle, solution, clues, target_met = self._run(_generate_job, holes, self.deadline, GENERATE_MAX_NODES)
+            return {"puzzle": puzzle, "solution": solution, "holes": holes, "clues": clues, "target_met": target_met}
+        difficulty = difficulty or "medium"
+        if difficulty not in DIFFICULTY_HOLES:
+            raise ValueError(f"difficulty must be one of {', '.join(DIFFICULTY_HOLES)}")
+        self._refill(difficulty)
+        try:
+            puzzle, solution, clues, target_met = self.ready[difficulty].get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("no puzzle was ready in time")
+        self._refill(difficulty)
+        return {"puzzle": puzzle, "solution": solution, "difficulty": difficulty, "clues": clues, "target_met": target_met}
+
+    def solve(self, text):
+        count, solution, nodes = self._run(_solve_job, format_grid(parse_puzzle(text)), self.max_nodes)
+        if count is None:
+            raise ValueError("search limit reached before the puzzle was solved")
+        return {"solution": solution, "unique": count == 1, "nodes": nodes}
+
+    def validate(self, text):
+        grid = parse_puzzle(text)
+        conflicts = find_conflicts(grid)
+        count = 0
+        if not conflicts:
+            count, _, _ = self._run(_solve_job, format_grid(grid), self.max_nodes)
+        return {
+            "valid": count == 1,
+            "conflicts": [list(pos) for pos in conflicts],
+            "solutions": count,
+            "complete": all(value for row in grid for value in row),
+        }
 
-        ttk.Button(
-            scroll_frame,
-            text=self.t("lang"),
-            style="game.TButton",
-            command=self.toggle_lang
-        ).pack(pady=10)
+    def rate(self, text):
+        return self._run(_rate_job, format_grid(parse_puzzle(text)), self.max_nodes)
+
+    def handle(self, endpoint, params):
+        """Run one endpoint with the request's parameters."""
+        if endpoint == "generate":
+            holes = params.get("holes")
+            return self.generate(params.get("difficulty"), None if holes is None else int(holes))
+        puzzle = params.get("puzzle")
+        if not isinstance(puzzle, str):
+            raise ValueError("missing 'puzzle'")
+        return getattr(self, endpoint)(puzzle)
+
+    def record(self, route, seconds):
+        with self.lock:
+            entry = self.latencies.setdefault(route, [0, deque(maxlen=1000)])
+            entry[0] += 1
+            entry[1].append(seconds)
+
+    def metrics(self):
+        """Request counts and recent latencies per route, plus queue levels."""
+        with self.lock:
+            report = {}
+            for route, (count, samples) in self.latencies.items():
+                ordered = sorted(samples)
+                report[route] = {
+                    "count": count,
+                    "p50_ms": round(percentile(ordered, 0.5) * 1000, 2),
+                    "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+        report["ready"] = {name: q.qsize() for name, q in self.ready.items()}
+        return report
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+class PuzzleRequestHandler(BaseHTTPRequestHandler):
+    """JSON API: /generate, /solve, /validate, /rate and /metrics.
+
+    Parameters come from the query string or a JSON request body.
+    """
+    endpoints = ("/generate", "/solve", "/validate", "/rate")
+
+    def do_GET(self):
+        self.handle_request({})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            self.reply(400, {"error": "request body must be a JSON object"})
+            return
+        self.handle_request(body)
 
-        # --- On/Off button ---
-        toggle_btn = ttk.Button(
-            scroll_frame,
-            text=self.t("music_off") if self.music else self.t("music_on"),
-            style="game.TButton",
-            command=toggle_music
+    def handle_request(self, body):
+        url = urlsplit(self.path)
+        service = self.server.service
+        if url.path == "/metrics":
+            self.reply(200, service.metrics())
+            return
+        if url.path not in self.endpoints:
+            self.reply(404, {"error": f"unknown endpoint {url.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            status, result = 200, service.handle(url.path[1:], {**dict(parse_qsl(url.query)), **body})
+        except (ValueError, TypeError, OverflowError) as e:
+            status, result = 400, {"error": str(e)}
+        except ServiceBusy as e:
+            status, result = 503, {"error": str(e)}
+        except (TimeoutError, concurrent.futures.TimeoutError):
+            status, result = 504, {"error": "timed out"}
+        except Exception as e:
+            # e.g. BrokenProcessPool; the client still gets an answer
+            self.log_error("%s on %s: %s", type(e).__name__, url.path, e)
+            status, result = 500, {"error": "internal error"}
+        elapsed = time.perf_counter() - start
+        service.record(url.path, elapsed)
+        self.reply(status, result, elapsed)
+
+    def reply(self, status, result, elapsed=None):
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if elapsed is not None:
+            self.send_header("Server-Timing", f"engine;dur={elapsed * 1000:.2f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve(host="127.0.0.1", port=8765, workers=None):
+    """Run the puzzle service until interrupted."""
+    service = PuzzleService(workers)
+    server = ThreadingHTTPServer((host, port), PuzzleRequestHandler)
+    server.service = service
+    print(f"Serving puzzles on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+# ASYNC API
+# Awaitable wrappers around the engine for asyncio services. Work runs on
+# executor (the loop's default thread pool when None; pass worker_pool() to
+# use processes). On timeout or cancellation, jobs that have not started
+# are cancelled and jobs running in threads are told to stop through a
+# threading.Event. Events can't reach other processes, so there a running
+# job ends at its deadline or node cap instead.
+def _cancel_event(executor):
+    return None if isinstance(executor, ProcessPoolExecutor) else threading.Event()
+
+async def generate_async(holes, executor=None, timeout=None, deadline=GENERATE_DEADLINE):
+    """Generate a puzzle within deadline seconds (see SudokuGenerator.generate);
+    returns (puzzle, solution, clues, target_met)."""
+    loop = asyncio.get_running_loop()
+    cancel = _cancel_event(executor)
+    try:
+        puzzle, solution, clues, target_met = await asyncio.wait_for(
+            loop.run_in_executor(executor, _generate_job, holes, deadline, GENERATE_MAX_NODES, cancel), timeout
         )
-        toggle_btn.pack(pady=10)
-
-        # --- Volume slider ---
-        volume_slider = tk.Scale(
-            scroll_frame,
-            from_=0,
-            to=100,
-            orient="horizontal",
-            resolution=0.05,
-            length=250,
-            bg=self.color,
-            foreground="white",
-            highlightthickness=0,
-            troughcolor="#022132",
-            command=set_volume
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        if cancel is not None:
+            cancel.set()
+        raise
+    return parse_grid(puzzle), parse_grid(solution), clues, target_met
+
+async def solve_async(grid, limit=2, max_nodes=200000, executor=None, timeout=None):
+    """Solve a grid; returns (count, solution, nodes) like solve_grid."""
+    loop = asyncio.get_running_loop()
+    cancel = _cancel_event(executor)
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(executor, solve_grid, grid, limit, max_nodes, cancel), timeout
         )
-        volume_slider.set(self.volume*100)
-        volume_slider.pack(pady=5)
-
-        def close_popup():
-            popup.destroy()
-            self.resume_timer()
-
-    
-        ttk.Button(
-            scroll_frame,
-            text=self.t("close"),
-            style="game.TButton",
-            command=close_popup
-        ).pack(pady=10)
-
-    def reopen_settings(self):
-    # Destroy current settings popup if it exists
-        for widget in self.master.winfo_children():
-            if isinstance(widget, tk.Toplevel) and widget.title() in ("Settings","Nastavení"):
-                widget.destroy()
-
-        # Recreate it
-        self.settings_popup()
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        if cancel is not None:
+            cancel.set()
+        raise
+
+async def iter_generate_async(holes, count, executor=None, timeout=None, concurrency=4,
+                              deadline=GENERATE_DEADLINE):
+    """Generate count puzzles, yielding (puzzle, solution, clues, target_met)
+    as each one finishes. timeout applies to the wait for every next puzzle."""
+    loop = asyncio.get_running_loop()
+    cancel = _cancel_event(executor)
+    pending = set()
+    started = 0
+    try:
+        while started < count or pending:
+            while started < count and len(pending) < concurrency:
+                pending.add(loop.run_in_executor(executor, _generate_job, holes, deadline, GENERATE_MAX_NODES, cancel))
+                started += 1
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for future in done:
+                puzzle, solution, clues, target_met = future.result()
+                yield parse_grid(puzzle), parse_grid(solution), clues, target_met
+    finally:
+        if cancel is not None:
+            cancel.set()
+        for future in pending:
+            future.cancel()
+
+# BULK SOLVER
+def _bulk_job(lines, max_nodes):
+    """Solve one chunk of corpus lines.
+
+    Returns (output line, seconds, nodes) per input line. When numpy is
+    available, naked-single propagation runs over the whole chunk first and
+    only the puzzles it can't finish are searched. A puzzle that singles
+    solve has exactly one solution.
+    """
+    results = [None] * len(lines)
+    grids = {}
+    for k, line in enumerate(lines):
+        try:
+            grids[k] = parse_puzzle(line.split()[0])
+        except ValueError:
+            results[k] = (f"{line.strip()},,invalid", 0.0, 0)
+
+    if np is not None and grids:
+        start = time.perf_counter()
+        keys = list(grids)
+        filled, status = batch_propagate([sum(grids[k], []) for k in keys])
+        share = (time.perf_counter() - start) / len(keys)
+        for k, row, done in zip(keys, filled, status):
+            if done:
+                solution = "".join(map(str, row)) if done == 1 else ""
+                verdict = "unique" if done == 1 else "none"
+                results[k] = (f"{format_grid(grids.pop(k))},{solution},{verdict}", share, 0)
+
+    for k, grid in grids.items():
+        start = time.perf_counter()
+        count, solution, nodes = solve_grid(grid, limit=2, max_nodes=max_nodes)
+        verdict = {None: "gave-up", 0: "none", 1: "unique"}.get(count, "multiple")
+        solution = format_grid(solution) if solution else ""
+        results[k] = (f"{format_grid(grid)},{solution},{verdict}", time.perf_counter() - start, nodes)
+    return results
+
+def bulk_solve(lines, out, workers=None, chunk_size=1000, slowest=10, max_nodes=None):
+    """Solve a corpus of one-puzzle-per-line text across worker processes.
+
+    Writes "puzzle,solution,verdict" lines to out in input order, where
+    verdict is unique, multiple, none, invalid or gave-up (max_nodes ran
+    out). Blank lines and lines starting with # are skipped. At most two
+    chunks per worker are in flight, so memory stays bounded whatever the
+    corpus size. Returns a summary with counts, puzzles/sec and the slowest
+    puzzles.
+    """
+    workers = workers or os.cpu_count() or 1
+    puzzles = (line for line in lines if line.strip() and not line.startswith("#"))
+    counts = {}
+    worst = []
+    total = 0
+    start = time.perf_counter()
+
+    def write(results):
+        nonlocal total
+        for text, seconds, nodes in results:
+            out.write(text + "\n")
+            verdict = text.rsplit(",", 1)[1]
+            counts[verdict] = counts.get(verdict, 0) + 1
+            entry = (seconds, nodes, total, text.split(",", 1)[0])
+            if len(worst) < slowest:
+                heapq.heappush(worst, entry)
+            elif slowest:
+                heapq.heappushpop(worst, entry)
+            total += 1
+
+    with worker_pool(workers) as pool:
+        window = deque()
+        while True:
+            chunk = list(itertools.islice(puzzles, chunk_size))
+            if not chunk:
+                break
+            window.append(pool.submit(_bulk_job, chunk, max_nodes))
+            if len(window) >= 2 * workers:
+                write(window.popleft().result())
+        while window:
+            write(window.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    return {
+        "puzzles": total,
+        "seconds": elapsed,
+        "per_second": total / elapsed if elapsed else 0.0,
+        "verdicts": counts,
+        "slowest": sorted(worst, reverse=True),
+    }
+
+def print_bulk_report(summary, file=sys.stderr):
+    print(
+        f"{summary['puzzles']} puzzles in {summary['seconds']:.2f} s "
+        f"({summary['per_second']:.0f} puzzles/s)",
+        file=file,
+    )
+    print(", ".join(f"{k}: {v}" for k, v in sorted(summary["verdicts"].items())), file=file)
+    if summary["slowest"]:
+        print("slowest:", file=file)
+        for seconds, nodes, index, puzzle in summary["slowest"]:
+            print(f"  #{index + 1:<8} {seconds * 1000:8.2f} ms {nodes:>9} nodes  {puzzle}", file=file)
+
+# REPLAY HARNESS
+def replay(script, tracer, difficulty=DIFFICULTY_HOLES["medium"], seed=0):
+    """Feed a scripted input sequence through the GUI handlers without a
+    player, timing everything with tracer.
+
+    One command per line, # starts a comment:
+        click ROW COL     number N      key CHAR|BackSpace|Delete
+        pencil  erase  mode  clear  undo  redo  new
+    The window and any dialogs (e.g. key r for the rules) stay hidden, and
+    the game is saved to a temporary folder. Audio is off, so neither pygame
+    nor music.mp3 is needed, but tkinter still needs a display (e.g. Xvfb
+    on CI). Scripts must not trigger message boxes (e.g. number with no
+    selection).
+    """
+    random.seed(seed)
+    root = tk.Tk()
+    root.withdraw()
+    with tempfile.TemporaryDirectory() as folder:
+        app = SudokuGUI(root, tracer=tracer, journal=GameJournal(folder), audio=False)
+        app.hide_dialogs = True
+        app.start_with_difficulty(difficulty)
+
+        def press(key):
+            special = key in ("BackSpace", "Delete")
+            event = SimpleNamespace(char="" if special else key, keysym=key, widget=root)
+            app.handle_key(event)
+            app.handle_key_input(event)
+
+        actions = {
+            "click": lambda row, col: app.cell_clicked(int(row), int(col)),
+            "number": lambda num: app.select_number(int(num), app.number_buttons[int(num) - 1]),
+            "key": press,
+            "pencil": lambda: app.toggle_Mode(True),
+            "erase": lambda: app.toggle_Mode(False),
+            "mode": app.toggle_inputMode,
+            "clear": app.clear_selection,
+            "undo": app.undo,
+            "redo": app.redo,
+            "new": lambda: app.start_with_difficulty(difficulty),
+        }
+        try:
+            for n, line in enumerate(script, 1):
+                words = line.split("#")[0].split()
+                if not words:
+                    continue
+                if words[0] not in actions:
+                    raise ValueError(f"line {n}: unknown command {words[0]!r}")
+                actions[words[0]](*words[1:])
+        finally:
+            app.timer.stop()
+            app.journal.close()
+            root.destroy()
+
+# DIFFERENTIAL BENCHMARK
+# Each engine takes a grid and returns (count, solution): count is the
+# number of solutions capped at 2, solution is one of them or None.
+def _reference_engine(grid):
+    """solve_count's search (is_valid, cells in row order), stopped at 2."""
+    generator = SudokuGenerator()
+    grid = copy.deepcopy(grid)
+    found = []
+
+    def backtrack():
+        for r in range(9):
+            for c in range(9):
+                if grid[r][c] == 0:
+                    for n in range(1, 10):
+                        if generator.is_valid(grid, r, c, n):
+                            grid[r][c] = n
+                            backtrack()
+                            grid[r][c] = 0
+                            if len(found) == 2:
+                                return
+                    return
+        found.append(copy.deepcopy(grid))
+
+    if not find_conflicts(grid):
+        backtrack()
+    return len(found), found[0] if found else None
+
+def _iter_engine(grid):
+    found = list(itertools.islice(iter_solutions(grid), 2))
+    return len(found), found[0] if found else None
+
+def _propagate_engine(grid):
+    grids, status = batch_propagate([grid])
+    if status[0] == -1:
+        return 0, None
+    count, solution, _ = solve_grid(grids[0].reshape(9, 9).tolist())
+    return count, solution
+
+BENCH_ENGINES = {
+    "reference": _reference_engine,
+    "solve_grid": lambda grid: solve_grid(grid)[:2],
+    "iter_solutions": _iter_engine,
+}
+if np is not None:
+    BENCH_ENGINES["batch_propagate"] = _propagate_engine
+
+# Puzzles that need thousands of search nodes even with fewest candidates
+# first, yet take the reference only seconds. (Famous ones such as Arto
+# Inkala's run for minutes under plain backtracking.)
+HARD_PUZZLES = [
+    "85...24..72......9..4.........1.7..23.5...9...4...........8..7..17..........36.4.",
+    "..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+    "12.3....435....1....4........54..2..6...7.........8.9...31..5.......9.7.....6...8",
+    "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+]
+
+def bench_puzzles(count=20, seed=0):
+    """Generated puzzles of every difficulty, plus variants with extra holes
+    (often several solutions), a wrong digit (often none) and HARD_PUZZLES."""
+    rng_state = random.getstate()
+    random.seed(seed)
+    generator = SudokuGenerator()
+    puzzles = []
+    try:
+        for n in range(count):
+            holes = list(DIFFICULTY_HOLES.values())[n % len(DIFFICULTY_HOLES)]
+            puzzle = generator.generate(holes)
+            puzzles.append(puzzle)
+            given = [(r, c) for r in range(9) for c in range(9) if puzzle[r][c]]
+            empty = [(r, c) for r in range(9) for c in range(9) if not puzzle[r][c]]
+            loose = copy.deepcopy(puzzle)
+            for r, c in random.sample(given, 3):
+                loose[r][c] = 0
+            puzzles.append(loose)
+            wrong = copy.deepcopy(puzzle)
+            r, c = random.choice(empty)
+            options = [d for d in range(1, 10) if d != generator.full_solution[r][c] and generator.is_valid(wrong, r, c, d)]
+            if options:
+                wrong[r][c] = random.choice(options)
+                puzzles.append(wrong)
+    finally:
+        random.setstate(rng_state)
+    return puzzles + [parse_puzzle(text) for text in HARD_PUZZLES]
+
+def _valid_solution(puzzle, solution):
+    """Whether solution is a full valid grid that keeps puzzle's clues."""
+    clues = [value for row in puzzle for value in row]
+    values = [value for row in solution for value in row]
+    return (
+        all(clue in (0, value) for clue, value in zip(clues, values))
+        and all(sorted(values[i] for i in unit) == list(range(1, 10)) for unit in UNITS)
+    )
+
+def differential_bench(puzzles, engines=None, baseline=None, tolerance=0.25):
+    """Run every engine on every puzzle and compare them with "reference".
+
+    Counts and uniqueness verdicts must match the reference exactly; for a
+    unique puzzle the solution must match too, otherwise it only has to be
+    a valid solution. An engine regresses when its speed ratio (reference
+    time / engine time) drops below 1, or more than tolerance below its
+    ratio in baseline (a dict of engine name to ratio).
+    Returns a report dict whose "failures" list is empty when all is well.
+    """
+    engines = engines or BENCH_ENGINES
+    seconds = dict.fromkeys(engines, 0.0)
+    verdicts = {0: 0, 1: 0, 2: 0}
+    failures = []
+    for index, puzzle in enumerate(puzzles):
+        results = {}
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            results[name] = engine(copy.deepcopy(puzzle))
+            seconds[name] += time.perf_counter() - start
+        expected, reference = results["reference"]
+        verdicts[expected] += 1
+        for name, (count, solution) in results.items():
+            if count != expected:
+                failures.append(f"{name}: puzzle #{index + 1} has {count} solutions, reference says {expected}")
+            elif count and (solution is None or not _valid_solution(puzzle, solution)):
+                failures.append(f"{name}: puzzle #{index + 1} got an invalid solution")
+            elif count == 1 and solution != reference:
+                failures.append(f"{name}: puzzle #{index + 1} got a different solution")
+    ratios = {name: seconds["reference"] / max(took, 1e-9) for name, took in seconds.items()}
+    for name, ratio in ratios.items():
+        floor = 1.0
+        if baseline and name in baseline:
+            floor = max(floor, baseline[name] * (1 - tolerance))
+        if name != "reference" and ratio < floor:
+            failures.append(f"{name}: {ratio:.1f}x reference speed, expected at least {floor:.1f}x")
+    return {"puzzles": len(puzzles), "verdicts": verdicts, "seconds": seconds, "ratios": ratios, "failures": failures}
+
+# Parallel digging variants, by the min_nodes they run with: 0 sends every
+# check to the pool, so both round shapes get exercised.
+DIG_ENGINES = {"dig_pool": 0, "dig_adaptive": PARALLEL_MIN_NODES}
+
+def _dig_in_order(grid, cells):
+    """Sequential digging: try removing cells one by one, in this order."""
+    grid = copy.deepcopy(grid)
+    for r, c in cells:
+        backup, grid[r][c] = grid[r][c], 0
+        if solve_grid(grid)[0] != 1:
+            grid[r][c] = backup
+    return grid
+
+def dig_bench(count=5, seed=0, workers=None, baseline=None, tolerance=0.25):
+    """Dig count full grids with remove_numbers_parallel for every variant
+    in DIG_ENGINES and compare with _dig_in_order on the same shuffled cells.
+
+    Speed ratios are sequential time / variant time. A single core can't
+    beat sequential digging, so only a drop of more than tolerance below
+    baseline counts as a regression. Returns a report like
+    differential_bench.
+    """
+    generator = SudokuGenerator()
+    seconds = {"dig_sequential": 0.0, **dict.fromkeys(DIG_ENGINES, 0.0)}
+    failures = []
+    rng_state = random.getstate()
+    random.seed(seed)
+    try:
+        with worker_pool(workers) as pool:
+            for index in range(count):
+                full = [[0] * 9 for _ in range(9)]
+                generator.fill_grid(full)
+                dig_state = random.getstate()
+                results = {}
+                for name, min_nodes in DIG_ENGINES.items():
+                    random.setstate(dig_state)
+                    start = time.perf_counter()
+                    results[name] = generator.remove_numbers_parallel(full, 81, pool, min_nodes=min_nodes)
+                    seconds[name] += time.perf_counter() - start
+                # Same shuffle as remove_numbers_parallel makes
+                random.setstate(dig_state)
+                cells = [(r, c) for r in range(9) for c in range(9)]
+                random.shuffle(cells)
+                start = time.perf_counter()
+                expected = _dig_in_order(full, cells)
+                seconds["dig_sequential"] += time.perf_counter() - start
+                for name, grid in results.items():
+                    if grid != expected:
+                        failures.append(f"{name}: grid #{index + 1} differs from digging one by one")
+    finally:
+        random.setstate(rng_state)
+    ratios = {name: seconds["dig_sequential"] / max(took, 1e-9) for name, took in seconds.items()}
+    for name, ratio in ratios.items():
+        if baseline and name in baseline and ratio < baseline[name] * (1 - tolerance):
+            failures.append(f"{name}: {ratio:.2f}x sequential speed, expected at least {baseline[name] * (1 - tolerance):.2f}x")
+    return {"grids": count, "seconds": seconds, "ratios": ratios, "failures": failures}
+
+def print_bench_report(report, file=sys.stderr):
+    if "verdicts" in report:
+        verdicts = report["verdicts"]
+        print(
+            f"{report['puzzles']} puzzles: {verdicts[1]} unique, {verdicts[2]} with several "
+            f"solutions, {verdicts[0]} with none",
+            file=file,
+        )
+    else:
+        print(f"{report['grids']} grids dug", file=file)
+    for name, took in report["seconds"].items():
+        print(f"  {name:<16} {took * 1000:10.1f} ms {report['ratios'][name]:10.1f}x", file=file)
+    for failure in report["failures"]:
+        print(f"FAIL {failure}", file=file)
+
+# COMMAND LINE
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sudoku", description="Sudoku game and puzzle engine.")
+    parser.add_argument("--trace", metavar="FILE", help="time GUI events, show a latency overlay and log samples to FILE")
+    commands = parser.add_subparsers(dest="command")
+
+    serve_cmd = commands.add_parser("serve", help="run the local HTTP puzzle service")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8765)
+    serve_cmd.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+
+    bulk_cmd = commands.add_parser("bulk", help="solve a file of puzzles, one 81-character puzzle per line")
+    bulk_cmd.add_argument("input", nargs="?", default="-", help="puzzle file (default: stdin)")
+    bulk_cmd.add_argument("-o", "--output", default="-", help="results file (default: stdout)")
+    bulk_cmd.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    bulk_cmd.add_argument("--chunk", type=int, default=1000, help="puzzles per job")
+    bulk_cmd.add_argument("--slowest", type=int, default=10, help="how many slow puzzles to report")
+    bulk_cmd.add_argument("--max-nodes", type=int, default=None, help="give up on a puzzle after this many nodes")
+
+    dedupe_cmd = commands.add_parser("dedupe", help="drop puzzles equivalent to earlier ones")
+    dedupe_cmd.add_argument("input", nargs="?", default="-", help="puzzle file (default: stdin)")
+    dedupe_cmd.add_argument("-o", "--output", default="-", help="unique puzzles (default: stdout)")
+    dedupe_cmd.add_argument("--index", default=None, help="index database (default: ~/.sudoku/puzzles.db)")
+
+    replay_cmd = commands.add_parser("replay", help="replay a scripted input sequence and report GUI latencies")
+    replay_cmd.add_argument("script", help="input script, one command per line")
+    replay_cmd.add_argument("--difficulty", type=int, default=DIFFICULTY_HOLES["medium"], help="holes in the puzzle")
+    replay_cmd.add_argument("--seed", type=int, default=0)
+
+    bench_cmd = commands.add_parser("bench", help="check the solvers and parallel digging agree with their references")
+    bench_cmd.add_argument("--count", type=int, default=20, help="generated puzzles (each adds up to two variants)")
+    bench_cmd.add_argument("--seed", type=int, default=0)
+    bench_cmd.add_argument("--baseline", default=None, help="JSON file of speed ratios to compare with")
+    bench_cmd.add_argument("--tolerance", type=float, default=0.25, help="allowed drop below the baseline ratios")
+    bench_cmd.add_argument("--save", default=None, help="write this run's speed ratios to a JSON file")
+    bench_cmd.add_argument("--dig", type=int, default=5, help="full grids to dig in parallel and one by one (0 to skip)")
+    bench_cmd.add_argument("--workers", type=int, default=None, help="worker processes for digging (default: CPU count)")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.workers)
+    elif args.command == "bulk":
+        source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            summary = bulk_solve(source, out, args.workers, args.chunk, args.slowest, args.max_nodes)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+        print_bulk_report(summary)
+    elif args.command == "dedupe":
+        index = PuzzleIndex(args.index)
+        source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            for grid in index.dedupe(read_puzzles(source)):
+                out.write(format_grid(grid) + "\n")
+        finally:
+            index.close()
+            if source is not sys.stdin:
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+    elif args.command == "replay":
+        tracer = LatencyTracer(args.trace)
+        with open(args.script, encoding="utf-8") as script:
+            replay(script, tracer, args.difficulty, args.seed)
+        tracer.close()
+        print(tracer.format_summary())
+    elif args.command == "bench":
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        reports = [differential_bench(bench_puzzles(args.count, args.seed), baseline=baseline, tolerance=args.tolerance)]
+        if args.dig:
+            reports.append(dig_bench(args.dig, args.seed, args.workers, baseline, args.tolerance))
+        for report in reports:
+            print_bench_report(report)
+        if args.save:
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump({name: ratio for report in reports for name, ratio in report["ratios"].items()}, f, indent=2)
+        if any(report["failures"] for report in reports):
+            sys.exit(1)
+    else:
+        run_gui(args.trace)
 
 # RUN GAME
-if __name__ == "__main__":
+def run_gui(trace=None):
     root = tk.Tk()
     root.attributes("-fullscreen", True)
     root.bind("<Escape>", lambda e: root.attributes("-fullscreen", False))
-    app = SudokuGUI(root)
+    tracer = LatencyTracer(trace) if trace else None
+    app = SudokuGUI(root, tracer=tracer)
     root.mainloop()
+    if tracer:
+        tracer.close()
+
+if __name__ == "__main__":
+    main()
 
     # czech and special rules :))
\ No newline at end of file